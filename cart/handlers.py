@@ -1,13 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from cart.queries import (
     orm_add_product_to_cart,
+    orm_apply_cart_operations,
     orm_checkout,
     orm_delete_product_from_cart,
     orm_get_cart,
     orm_update_product_quantity_in_cart,
 )
+from cart.schemas import CartBatch, CartRead
 from database import get_session
 from exceptions import (
     CartNotFound,
@@ -19,7 +21,6 @@ from exceptions import (
 from security.token import get_current_user
 from users.models import User
 
-
 router = APIRouter(prefix="/cart", tags=["cart"])
 
 
@@ -34,15 +35,14 @@ async def checkout(
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="cart not found"
         )
-    except ProductNotFound:
+    except InsufficientStock as e:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="product not found"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": e.message, "items": e.items},
         )
-    except InsufficientStock as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
 
 
-@router.get("/")
+@router.get("/", response_model=CartRead)
 async def get_cart(
     session: AsyncSession = Depends(get_session), user: User = Depends(get_current_user)
 ):
@@ -55,10 +55,10 @@ async def get_cart(
         )
 
 
-@router.post("/add-product")
+@router.post("/add-product", response_model=CartRead)
 async def add_product_to_cart(
     product_id: int,
-    quantity: int = 1,
+    quantity: int = Query(1, ge=1),
     session: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user),
 ):
@@ -73,7 +73,7 @@ async def add_product_to_cart(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
 
 
-@router.delete("/delete-product")
+@router.delete("/delete-product", response_model=CartRead)
 async def delete_product_from_cart(
     product_id: int,
     session: AsyncSession = Depends(get_session),
@@ -88,10 +88,10 @@ async def delete_product_from_cart(
         )
 
 
-@router.post("/update-quantity")
+@router.post("/update-quantity", response_model=CartRead)
 async def update_product_quantity_in_cart(
     product_id: int,
-    quantity: int = 1,
+    quantity: int = Query(1, ge=1),
     session: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user),
 ):
@@ -114,3 +114,22 @@ async def update_product_quantity_in_cart(
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="cart item not found"
         )
+
+
+@router.patch("", response_model=CartRead)
+async def apply_cart_operations(
+    batch: CartBatch,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    try:
+        return await orm_apply_cart_operations(session, user.id, batch.operations)
+    except ProductNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="product not found"
+        )
+    except InsufficientStock as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": e.message, "items": e.items},
+        )
@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import Integer, ForeignKey, DateTime
+from sqlalchemy import Integer, ForeignKey, DateTime, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from database import Base
@@ -13,7 +13,10 @@ class Cart(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("users.id"), nullable=False, unique=True
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
     )
     created_at: Mapped[DateTime] = mapped_column(
         DateTime(timezone=True), default=datetime.now(timezone.utc)
@@ -21,12 +24,16 @@ class Cart(Base):
 
     user: Mapped["User"] = relationship(back_populates="cart")
     cart_items: Mapped[list["CartItem"]] = relationship(
-        back_populates="cart", cascade="all, delete-orphan"
+        back_populates="cart", cascade="all, delete-orphan", passive_deletes=True
     )
 
 
 class CartItem(Base):
     __tablename__ = "cart_items"
+    __table_args__ = (
+        # одна позиция на товар: цель ON CONFLICT при добавлении в корзину
+        Index("ix_cart_items_cart_id_product_id", "cart_id", "product_id", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     cart_id: Mapped[int] = mapped_column(
@@ -39,3 +46,24 @@ class CartItem(Base):
 
     cart: Mapped["Cart"] = relationship(back_populates="cart_items")
     product: Mapped["Product"] = relationship()
+
+
+class StockReservation(Base):
+    """
+    удержание товара позицией корзины до expires_at. просроченные снимает
+    фоновая задача (cart.reservations), при оформлении заказа удержания
+    удаляются вместе с корзиной
+    """
+
+    __tablename__ = "stock_reservations"
+
+    cart_item_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("cart_items.id", ondelete="CASCADE"), primary_key=True
+    )
+    product_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False
+    )
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False)
+    expires_at: Mapped[DateTime] = mapped_column(
+        DateTime(timezone=True), nullable=False, index=True
+    )
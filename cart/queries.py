@@ -1,110 +1,248 @@
-from sqlalchemy import select
+from sqlalchemy import (
+    Integer,
+    column,
+    delete,
+    func,
+    literal,
+    select,
+    true,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from cart.models import Cart, CartItem
+from cart.models import Cart, CartItem, StockReservation
+from cart.reservations import (
+    hold_items,
+    orm_get_short_items,
+    orm_hold_cart_items,
+    orm_lock_reservations,
+)
+from cart.schemas import CartItemRead, CartOperation, CartRead
 from exceptions import (
     ProductNotFound,
     InsufficientStock,
     CartNotFound,
     CartItemNotFound,
 )
-from products.models import Product
-from products.queries import orm_get_product_by_id
+from products.cache import product_cache
+from products.models import Product, ProductReservation
+from products.stats import product_stats
 
 
 async def orm_checkout(session: AsyncSession, user_id: int):
-    cart = await orm_get_cart(session, user_id)
-    if not cart:
-        raise CartNotFound()
+    """
+    оформление заказа одной транзакцией: строки товаров и их сумм удержаний
+    блокируются в порядке id (две корзины с одними товарами не ждут друг друга
+    крест-накрест), затем весь остаток списывается одним UPDATE ... FROM
+    (VALUES ...). удержания корзины превращаются в продажу: позиции доступен
+    stock - reserved плюс ее собственное удержание. если чего-то не хватает,
+    ничего не списывается и в ошибке перечислены все такие позиции
+    """
+    cart_id = await _lock_cart(session, user_id)
 
-    for item in cart.items:
-        product = await session.get(Product, item["product_id"])
-        if not product:
-            raise ProductNotFound()
-        if product.stock < item["quantity"]:
-            raise InsufficientStock(
-                message=f'not enough stock fot product "{product.name}". available {product.stock}'
-            )
-        product.stock -= item["quantity"]
+    wanted = (
+        select(
+            CartItem.product_id,
+            func.sum(CartItem.quantity).label("quantity"),
+            func.coalesce(func.sum(StockReservation.quantity), 0).label("held"),
+        )
+        .outerjoin(StockReservation, StockReservation.cart_item_id == CartItem.id)
+        .where(CartItem.cart_id == cart_id)
+        .group_by(CartItem.product_id)
+        .subquery()
+    )
+    available = (Product.stock - ProductReservation.reserved + wanted.c.held).label(
+        "available"
+    )
+    query = (
+        select(Product.id, Product.name, available, wanted.c.quantity)
+        .join(wanted, wanted.c.product_id == Product.id)
+        .join(ProductReservation, ProductReservation.product_id == Product.id)
+        .order_by(Product.id)
+        # FOR NO KEY UPDATE: не мешает проверкам внешних ключей (FOR KEY SHARE)
+        # при параллельной вставке позиций корзин с этими товарами. сумму
+        # удержаний меняют триггеры под той же блокировкой, поэтому она читается
+        # свежей и не может вырасти до конца транзакции
+        .with_for_update(of=(Product, ProductReservation), key_share=True)
+    )
+    result = await session.execute(query)
+    rows = result.all()
 
-    await session.delete(cart)
+    short = [
+        {
+            "product_id": row.id,
+            "name": row.name,
+            "requested": row.quantity,
+            "available": max(row.available, 0),
+        }
+        for row in rows
+        if row.available < row.quantity
+    ]
+    if short:
+        await session.rollback()
+        raise _insufficient(short)
+
+    quantities = {row.id: int(row.quantity) for row in rows}
+    if quantities:
+        delta = values(
+            column("product_id", Integer), column("quantity", Integer), name="delta"
+        ).data(list(quantities.items()))
+        query = (
+            update(Product)
+            .where(Product.id == delta.c.product_id, Product.stock >= delta.c.quantity)
+            .values(stock=Product.stock - delta.c.quantity)
+            .returning(Product.id)
+        )
+        result = await session.execute(query)
+        # строки заблокированы выше, так что условие не может не выполниться
+        if len(result.all()) != len(quantities):
+            await session.rollback()
+            raise InsufficientStock(message="stock changed during checkout")
+
+    # удержания удаляются каскадом вместе с позициями, reserved уменьшает триггер
+    await session.execute(delete(Cart).where(Cart.id == cart_id))
     await session.commit()
+    await product_cache.delete(*quantities)
+    product_stats.record_sales(quantities)
+
+
+def _insufficient(short: list[dict]) -> InsufficientStock:
+    names = ", ".join(f'"{item["name"]}"' for item in short)
+    return InsufficientStock(message=f"not enough stock for {names}", items=short)
 
 
-async def orm_get_cart(session: AsyncSession, user_id: int):
-    query = select(Cart).where(Cart.user_id == user_id)
+async def _lock_cart(session: AsyncSession, user_id: int) -> int:
+    """
+    id корзины под FOR UPDATE. изменения корзины сначала блокируют ее строку,
+    потом суммы удержаний и позиции: в том же порядке, что и checkout, иначе
+    checkout и правка позиции того же пользователя ждали бы друг друга
+    """
+    query = select(Cart.id).where(Cart.user_id == user_id).with_for_update()
     result = await session.execute(query)
-    cart = result.scalar_one_or_none()
-    if not cart:
+    cart_id = result.scalar_one_or_none()
+    if cart_id is None:
         raise CartNotFound()
+    return cart_id
 
-    query = select(CartItem).where(CartItem.cart_id == cart.id)
+
+async def orm_get_cart(session: AsyncSession, user_id: int) -> CartRead:
+    """
+    корзина с товарами одним запросом: carts, cart_items и products соединяются
+    в бд, стоимость позиций и сумма корзины тоже считаются там
+    """
+    line_total = (Product.price * CartItem.quantity).label("line_total")
+    query = (
+        select(
+            Cart.id,
+            Cart.user_id,
+            Cart.created_at,
+            CartItem.product_id,
+            CartItem.quantity,
+            Product.name,
+            Product.price,
+            line_total,
+            StockReservation.expires_at.label("reserved_until"),
+            func.coalesce(func.sum(Product.price * CartItem.quantity).over(), 0).label(
+                "subtotal"
+            ),
+        )
+        .outerjoin(CartItem, CartItem.cart_id == Cart.id)
+        .outerjoin(Product, Product.id == CartItem.product_id)
+        .outerjoin(StockReservation, StockReservation.cart_item_id == CartItem.id)
+        .where(Cart.user_id == user_id)
+        .order_by(CartItem.id)
+    )
     result = await session.execute(query)
-    cart_items = result.scalars().all()
-
-    products = []
-    for cart_item in cart_items:
-        product_data = await session.get(Product, cart_item.product_id)
-        products.append(
-            {
-                "product_id": cart_item.product_id,
-                "quantity": cart_item.quantity,
-                "name": product_data.name,
-                "price": product_data.price,
-            }
+    rows = result.all()
+    if not rows:
+        raise CartNotFound()
+
+    first = rows[0]
+    # у пустой корзины одна строка с NULL вместо позиции
+    items = [
+        CartItemRead(
+            product_id=row.product_id,
+            name=row.name,
+            price=row.price,
+            quantity=row.quantity,
+            line_total=row.line_total,
+            reserved_until=row.reserved_until,
         )
-    cart.items = products
-    return cart
+        for row in rows
+        if row.product_id is not None
+    ]
+    return CartRead(
+        id=first.id,
+        user_id=first.user_id,
+        created_at=first.created_at,
+        items=items,
+        subtotal=first.subtotal,
+    )
+
+
+def _upsert_cart(user_id: int):
+    """INSERT корзины пользователя, который возвращает id и новой, и существующей"""
+    new_cart = pg_insert(Cart).values(user_id=user_id)
+    return new_cart.on_conflict_do_update(
+        index_elements=[Cart.user_id], set_={"user_id": new_cart.excluded.user_id}
+    ).returning(Cart.id)
 
 
 async def orm_add_product_to_cart(
     session: AsyncSession, user_id: int, product_id: int, quantity: int = 1
 ):
-
-    product = await orm_get_product_by_id(session, product_id)
-
-    if not product:
+    """
+    добавление в корзину одним INSERT ... ON CONFLICT: корзина создается или
+    находится в CTE, позиция вставляется или увеличивается, под ее итоговое
+    количество ставится удержание на RESERVATION_TTL. вторым запросом
+    проверяется, что с учетом чужих удержаний товара хватает
+    """
+    cart = _upsert_cart(user_id).cte("cart")
+    item = pg_insert(CartItem)
+    item = (
+        item.from_select(
+            ["cart_id", "product_id", "quantity"],
+            # корзина одна строка: соединение с товаром без условия
+            select(cart.c.id, Product.id, literal(quantity))
+            .select_from(cart.join(Product, true()))
+            .where(Product.id == product_id),
+        )
+        .on_conflict_do_update(
+            index_elements=[CartItem.cart_id, CartItem.product_id],
+            set_={"quantity": CartItem.quantity + item.excluded.quantity},
+        )
+        .returning(CartItem.id, CartItem.product_id, CartItem.quantity)
+        .cte("item")
+    )
+    query = hold_items(select(item.c.id, item.c.product_id, item.c.quantity))
+    result = await session.execute(query.returning(StockReservation.cart_item_id))
+    cart_item_id = result.scalar_one_or_none()
+    if cart_item_id is None:
+        await session.rollback()
         raise ProductNotFound()
 
-    if product.stock < quantity:
+    short = await orm_get_short_items(session, CartItem.id == cart_item_id)
+    if short:
+        await session.rollback()
         raise InsufficientStock(
-            message=f"not enough stock for {product.name}. available: {product.stock}"
+            message=f"not enough stock for {short[0]['name']}. "
+            f"available: {short[0]['available']}",
+            items=short,
         )
 
-    try:
-        cart = await orm_get_cart(session, user_id)
-    except CartNotFound:
-        cart = Cart(user_id=user_id)
-        session.add(cart)
-        await session.commit()
-        await session.refresh(cart)
-
-    query = select(CartItem).where(
-        CartItem.cart_id == cart.id, CartItem.product_id == product_id
-    )
-    result = await session.execute(query)
-    cart_item = result.scalar_one_or_none()
-
-    if cart_item:
-        cart_item.quantity += quantity
-    else:
-        cart_item = CartItem(cart_id=cart.id, product_id=product_id, quantity=quantity)
-        session.add(cart_item)
     await session.commit()
-
-    return cart
+    return await orm_get_cart(session, user_id)
 
 
 async def orm_delete_product_from_cart(
     session: AsyncSession, user_id: int, product_id: int
 ):
-    cart = await orm_get_cart(session, user_id)
-
-    if not cart:
-        raise CartNotFound()
+    cart_id = await _lock_cart(session, user_id)
 
     query = select(CartItem).where(
-        CartItem.cart_id == cart.id, CartItem.product_id == product_id
+        CartItem.cart_id == cart_id, CartItem.product_id == product_id
     )
     result = await session.execute(query)
     cart_item = result.scalar_one_or_none()
@@ -115,32 +253,115 @@ async def orm_delete_product_from_cart(
     await session.delete(cart_item)
     await session.commit()
 
-    return cart
+    return await orm_get_cart(session, user_id)
 
 
 async def orm_update_product_quantity_in_cart(
     session: AsyncSession, user_id: int, product_id: int, quantity: int = 1
 ):
-    cart = await orm_get_cart(session, user_id)
-    if not cart:
-        raise CartNotFound()
+    cart_id = await _lock_cart(session, user_id)
 
-    query = select(CartItem).where(
-        CartItem.cart_id == cart.id, CartItem.product_id == product_id
+    query = (
+        update(CartItem)
+        .where(CartItem.cart_id == cart_id, CartItem.product_id == product_id)
+        .values(quantity=quantity)
+        .returning(CartItem.id)
     )
     result = await session.execute(query)
-    cart_item = result.scalar_one_or_none()
-    if not cart_item:
+    cart_item_id = result.scalar_one_or_none()
+    if cart_item_id is None:
         raise CartItemNotFound()
 
-    product = await session.get(Product, product_id)
-    if not product:
-        raise ProductNotFound()
-    if product.stock < quantity:
+    await orm_hold_cart_items(session, cart_id, [product_id])
+    short = await orm_get_short_items(session, CartItem.id == cart_item_id)
+    if short:
+        await session.rollback()
         raise InsufficientStock(
-            message=f"not enough stock for {product.name}. available: {product.stock}"
+            message=f"not enough stock for {short[0]['name']}. "
+            f"available: {short[0]['available']}",
+            items=short,
+        )
+
+    await session.commit()
+    return await orm_get_cart(session, user_id)
+
+
+def _fold_operations(
+    operations: list[CartOperation],
+) -> tuple[set[int], dict[int, int]]:
+    """
+    сводит операции к итогу по каждому товару: какие позиции удалить и сколько
+    затем прибавить. set превращается в удаление и прибавление, add после set
+    или remove прибавляется к новому значению
+    """
+    replaced: set[int] = set()
+    added: dict[int, int] = {}
+    for operation in operations:
+        product_id = operation.product_id
+        if operation.op == "add":
+            added[product_id] = added.get(product_id, 0) + operation.quantity
+            continue
+        replaced.add(product_id)
+        added.pop(product_id, None)
+        if operation.op == "set":
+            added[product_id] = operation.quantity
+    return replaced, added
+
+
+async def orm_apply_cart_operations(
+    session: AsyncSession, user_id: int, operations: list[CartOperation]
+) -> CartRead:
+    """
+    применяет пачку операций add/set/remove одной транзакцией: удаление одним
+    DELETE, добавление одним INSERT ... ON CONFLICT, удержания под итоговые
+    количества одним INSERT, затем одна проверка остатков по всем затронутым
+    товарам. если что-то не так, не меняется ничего. суммы удержаний всех
+    затронутых товаров блокируются заранее одним запросом в порядке id, иначе
+    DELETE и INSERT блокировали бы их двумя заходами вразнобой с checkout
+    """
+    replaced, added = _fold_operations(operations)
+    result = await session.execute(_upsert_cart(user_id))
+    cart_id = result.scalar_one()
+    await orm_lock_reservations(session, replaced | added.keys())
+
+    if replaced:
+        await session.execute(
+            delete(CartItem).where(
+                CartItem.cart_id == cart_id, CartItem.product_id.in_(sorted(replaced))
+            )
+        )
+
+    if added:
+        # строки VALUES по порядку id: в нем же идут проверки внешних ключей
+        delta = values(
+            column("product_id", Integer), column("quantity", Integer), name="delta"
+        ).data(sorted(added.items()))
+        item = pg_insert(CartItem)
+        query = (
+            item.from_select(
+                ["cart_id", "product_id", "quantity"],
+                select(literal(cart_id), Product.id, delta.c.quantity).join(
+                    delta, delta.c.product_id == Product.id
+                ),
+            )
+            .on_conflict_do_update(
+                index_elements=[CartItem.cart_id, CartItem.product_id],
+                set_={"quantity": CartItem.quantity + item.excluded.quantity},
+            )
+            .returning(CartItem.product_id)
+        )
+        result = await session.execute(query)
+        if len(result.all()) != len(added):
+            await session.rollback()
+            raise ProductNotFound()
+
+        await orm_hold_cart_items(session, cart_id, added)
+        short = await orm_get_short_items(
+            session, CartItem.cart_id == cart_id, CartItem.product_id.in_(added)
         )
+        if short:
+            await session.rollback()
+            raise _insufficient(short)
 
-    cart_item.quantity = quantity
     await session.commit()
-    return cart
+    return await orm_get_cart(session, user_id)
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Iterable
+
+from sqlalchemy import ColumnElement, Select, delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cart.models import CartItem, StockReservation
+from config import (
+    RESERVATION_SWEEP_BATCH,
+    RESERVATION_SWEEP_INTERVAL,
+    RESERVATION_TTL,
+)
+from database import new_session
+from products.models import Product, ProductReservation
+
+logger = logging.getLogger(__name__)
+
+
+def hold_items(rows: Select):
+    """
+    INSERT удержаний для строк (cart_item_id, product_id, quantity): новое
+    удержание или продление существующего на RESERVATION_TTL с новым количеством
+    """
+    expires_at = func.now() + timedelta(seconds=RESERVATION_TTL)
+    hold = pg_insert(StockReservation).from_select(
+        ["cart_item_id", "product_id", "quantity", "expires_at"],
+        rows.add_columns(expires_at),
+    )
+    return hold.on_conflict_do_update(
+        index_elements=[StockReservation.cart_item_id],
+        set_={
+            "quantity": hold.excluded.quantity,
+            "expires_at": hold.excluded.expires_at,
+        },
+    )
+
+
+async def orm_hold_cart_items(
+    session: AsyncSession, cart_id: int, product_ids: Iterable[int]
+) -> None:
+    """продлевает удержания позиций корзины под их текущее количество"""
+    rows = select(CartItem.id, CartItem.product_id, CartItem.quantity).where(
+        CartItem.cart_id == cart_id, CartItem.product_id.in_(list(product_ids))
+    )
+    await session.execute(hold_items(rows))
+
+
+async def orm_lock_reservations(
+    session: AsyncSession, product_ids: Iterable[int]
+) -> None:
+    """
+    блокирует суммы удержаний товаров в порядке id, как оформление заказа и
+    триггеры. нужно, когда удержания меняются несколькими операторами: каждый
+    триггер блокирует свои строки по порядку, но вместе они порядок нарушают
+    """
+    query = (
+        select(ProductReservation.product_id)
+        .where(ProductReservation.product_id.in_(sorted(product_ids)))
+        .order_by(ProductReservation.product_id)
+        .with_for_update(key_share=True)
+    )
+    await session.execute(query)
+
+
+async def orm_get_short_items(
+    session: AsyncSession, *conditions: ColumnElement[bool]
+) -> list[dict]:
+    """
+    позиции корзины (отобранные conditions по cart_items), которым не хватает
+    товара с учетом чужих удержаний. собственное удержание позиции уже входит в
+    reserved, поэтому ей доступно stock - reserved + его количество
+    """
+    available = (
+        Product.stock
+        - ProductReservation.reserved
+        + func.coalesce(StockReservation.quantity, 0)
+    ).label("available")
+    query = (
+        select(Product.id, Product.name, CartItem.quantity, available)
+        .join(CartItem, CartItem.product_id == Product.id)
+        .join(ProductReservation, ProductReservation.product_id == Product.id)
+        .outerjoin(StockReservation, StockReservation.cart_item_id == CartItem.id)
+        .where(available < CartItem.quantity, *conditions)
+        .order_by(Product.id)
+    )
+    result = await session.execute(query)
+    return [
+        {
+            "product_id": product_id,
+            "name": name,
+            "requested": requested,
+            "available": max(available, 0),
+        }
+        for product_id, name, requested, available in result.all()
+    ]
+
+
+async def orm_release_expired(
+    session: AsyncSession, batch_size: int = RESERVATION_SWEEP_BATCH
+) -> int:
+    """
+    снимает пачку просроченных удержаний; строки, занятые другими
+    транзакциями, пропускаются. product_reservations уменьшает триггер
+    """
+    expired = (
+        select(StockReservation.cart_item_id)
+        .where(StockReservation.expires_at < func.now())
+        .order_by(StockReservation.expires_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    query = (
+        delete(StockReservation)
+        .where(StockReservation.cart_item_id.in_(expired.scalar_subquery()))
+        .returning(StockReservation.cart_item_id)
+    )
+    result = await session.execute(query)
+    released = len(result.all())
+    await session.commit()
+    return released
+
+
+async def run_reservation_sweeper():
+    while True:
+        try:
+            while True:
+                async with new_session() as session:
+                    released = await orm_release_expired(session)
+                if released < RESERVATION_SWEEP_BATCH:
+                    break
+        except Exception:
+            logger.exception("stock reservation sweep failed")
+        await asyncio.sleep(RESERVATION_SWEEP_INTERVAL)
@@ -0,0 +1,41 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field, model_validator
+
+from config import MAX_CART_OPERATIONS
+
+
+class CartItemRead(BaseModel):
+    product_id: int
+    name: str
+    price: float
+    quantity: int
+    line_total: float
+    # до какого времени товар удержан за корзиной; None - удержание истекло
+    reserved_until: Optional[datetime] = None
+
+
+class CartRead(BaseModel):
+    id: int
+    user_id: int
+    created_at: Optional[datetime]
+    items: list[CartItemRead]
+    subtotal: float
+
+
+class CartOperation(BaseModel):
+    op: Literal["add", "set", "remove"]
+    product_id: int
+    # для add - на сколько увеличить, для set - итоговое количество
+    quantity: Optional[int] = Field(None, gt=0)
+
+    @model_validator(mode="after")
+    def check_quantity(self):
+        if self.op != "remove" and self.quantity is None:
+            raise ValueError(f"quantity is required for {self.op}")
+        return self
+
+
+class CartBatch(BaseModel):
+    operations: list[CartOperation] = Field(max_length=MAX_CART_OPERATIONS)
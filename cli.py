@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime
+
+from config import EXPORT_FETCH_SIZE
+from database import new_session
+from exceptions import InvalidFileEncoding, UnsupportedFileFormat
+from users import models
+from security import models
+from products import models
+from cart import models
+from comments import models
+from storage import models
+from products.bulk_import import detect_format, orm_import_products
+from products.export import stream_products
+
+
+async def import_products(args):
+    with open(args.path, "rb") as file:
+        async with new_session() as session:
+            try:
+                report = await orm_import_products(session, file, args.file_format)
+            except InvalidFileEncoding:
+                sys.exit("file must be utf-8 encoded")
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+async def export_products(args):
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        async with new_session() as session:
+            async for chunk in stream_products(
+                session,
+                args.file_format,
+                args.category_id,
+                args.updated_since,
+                args.fetch_size,
+            ):
+                output.write(chunk)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="marketplace management commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser(
+        "import-products", help="bulk import products from csv or ndjson"
+    )
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", dest="file_format", default=None)
+    import_parser.set_defaults(handler=import_products)
+
+    export_parser = commands.add_parser(
+        "export-products", help="stream the product catalog as ndjson or csv"
+    )
+    export_parser.add_argument(
+        "--format", dest="file_format", choices=["ndjson", "csv"], default="ndjson"
+    )
+    export_parser.add_argument("--output", help="file path, stdout by default")
+    export_parser.add_argument("--category-id", type=int)
+    export_parser.add_argument("--updated-since", type=datetime.fromisoformat)
+    export_parser.add_argument("--fetch-size", type=int, default=EXPORT_FETCH_SIZE)
+    export_parser.set_defaults(handler=export_products)
+
+    args = parser.parse_args()
+    if args.command == "import-products":
+        try:
+            args.file_format = detect_format(args.path, args.file_format)
+        except UnsupportedFileFormat:
+            parser.error("unsupported file format, use csv or ndjson")
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
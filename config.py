@@ -13,3 +13,76 @@ DB_NAME = os.environ.get("DB_NAME")
 
 SECRET_KEY = os.environ.get("SECRET_KEY")
 ALGORITHM = os.environ.get("ALGORITHM")
+
+# стратегия подсчета total для листингов: exact, cached или approximate
+PRODUCTS_COUNT_STRATEGY = os.environ.get("PRODUCTS_COUNT_STRATEGY", "exact")
+CATEGORY_PRODUCTS_COUNT_STRATEGY = os.environ.get(
+    "CATEGORY_PRODUCTS_COUNT_STRATEGY", "exact"
+)
+COUNT_CACHE_TTL = int(os.environ.get("COUNT_CACHE_TTL", 60))
+APPROXIMATE_COUNT_THRESHOLD = int(os.environ.get("APPROXIMATE_COUNT_THRESHOLD", 10000))
+
+# кэш товаров по id: memory (LRU в процессе) или redis
+PRODUCT_CACHE_BACKEND = os.environ.get("PRODUCT_CACHE_BACKEND", "memory")
+PRODUCT_CACHE_URL = os.environ.get("PRODUCT_CACHE_URL", "redis://localhost:6379/0")
+PRODUCT_CACHE_TTL = int(os.environ.get("PRODUCT_CACHE_TTL", 60))
+PRODUCT_CACHE_SIZE = int(os.environ.get("PRODUCT_CACHE_SIZE", 10000))
+
+# загрузка изображений товаров
+IMAGES_DIR = os.environ.get("IMAGES_DIR", "images")
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 64 * 1024))
+MAX_IMAGE_SIZE = int(os.environ.get("MAX_IMAGE_SIZE", 10 * 1024 * 1024))
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", 50 * 1024 * 1024))
+IMAGE_PROCESS_WORKERS = int(os.environ.get("IMAGE_PROCESS_WORKERS", 2))
+# весь multipart-запрос: проверяется до разбора формы (storage.uploads.UploadSizeLimit)
+MAX_REQUEST_SIZE = int(
+    os.environ.get("MAX_REQUEST_SIZE", MAX_UPLOAD_SIZE + 1024 * 1024)
+)
+
+# фоновое удаление файлов изображений
+IMAGE_CLEANUP_INTERVAL = int(os.environ.get("IMAGE_CLEANUP_INTERVAL", 10))
+IMAGE_CLEANUP_BATCH = int(os.environ.get("IMAGE_CLEANUP_BATCH", 500))
+ORPHAN_SWEEP_INTERVAL = int(os.environ.get("ORPHAN_SWEEP_INTERVAL", 6 * 60 * 60))
+# файлы моложе этого возраста не считаются сиротами (загрузка может быть в процессе)
+ORPHAN_GRACE_PERIOD = int(os.environ.get("ORPHAN_GRACE_PERIOD", 60 * 60))
+
+# массовый импорт товаров
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 1000))
+MAX_IMPORT_SIZE = int(os.environ.get("MAX_IMPORT_SIZE", 512 * 1024 * 1024))
+
+# выгрузка каталога
+EXPORT_FETCH_SIZE = int(os.environ.get("EXPORT_FETCH_SIZE", 1000))
+
+# сколько комментариев отдавать вместе с карточкой товара
+PRODUCT_DETAIL_COMMENTS = int(os.environ.get("PRODUCT_DETAIL_COMMENTS", 20))
+# сколько товаров можно запросить одним GET /products?ids=...
+MAX_PRODUCT_IDS = int(os.environ.get("MAX_PRODUCT_IDS", 100))
+
+# сколько секунд запрос ждет общий результат одинаковых параллельных чтений
+SINGLEFLIGHT_TIMEOUT = float(os.environ.get("SINGLEFLIGHT_TIMEOUT", 5))
+
+# снимок списка категорий; другие воркеры узнают об изменениях не позже ttl
+CATEGORY_SNAPSHOT_TTL = int(os.environ.get("CATEGORY_SNAPSHOT_TTL", 60))
+
+# фасеты (категории и гистограмма цен) для сочетаний фильтров
+FACET_CACHE_TTL = int(os.environ.get("FACET_CACHE_TTL", 60))
+FACET_CACHE_SIZE = int(os.environ.get("FACET_CACHE_SIZE", 1024))
+MAX_FACET_BUCKETS = int(os.environ.get("MAX_FACET_BUCKETS", 50))
+
+# счетчики просмотров и продаж копятся в памяти и сбрасываются в бд пачками
+STATS_FLUSH_INTERVAL = int(os.environ.get("STATS_FLUSH_INTERVAL", 10))
+STATS_FLUSH_BATCH = int(os.environ.get("STATS_FLUSH_BATCH", 1000))
+
+# индекс подсказок по названиям перестраивается, чтобы подхватить изменения других воркеров
+AUTOCOMPLETE_REBUILD_INTERVAL = int(
+    os.environ.get("AUTOCOMPLETE_REBUILD_INTERVAL", 600)
+)
+MAX_AUTOCOMPLETE_LIMIT = int(os.environ.get("MAX_AUTOCOMPLETE_LIMIT", 20))
+
+# сколько операций можно передать одним PATCH /cart
+MAX_CART_OPERATIONS = int(os.environ.get("MAX_CART_OPERATIONS", 200))
+
+# удержание товара в корзине: срок и фоновое снятие просроченных
+RESERVATION_TTL = int(os.environ.get("RESERVATION_TTL", 15 * 60))
+RESERVATION_SWEEP_INTERVAL = int(os.environ.get("RESERVATION_SWEEP_INTERVAL", 30))
+RESERVATION_SWEEP_BATCH = int(os.environ.get("RESERVATION_SWEEP_BATCH", 1000))
@@ -0,0 +1,6 @@
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """совпадает ли etag с одним из значений заголовка If-None-Match"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
@@ -1,3 +1,6 @@
+from typing import Optional
+
+
 class CategoryNotFound(Exception):
     pass
 
@@ -7,8 +10,10 @@ class ProductNotFound(Exception):
 
 
 class InsufficientStock(Exception):
-    def __init__(self, message: str):
+    def __init__(self, message: str, items: Optional[list[dict]] = None):
         self.message = message
+        # все позиции, которых не хватает: product_id, name, requested, available
+        self.items = items or []
 
 
 class CartNotFound(Exception):
@@ -21,3 +26,24 @@ class CartItemNotFound(Exception):
 
 class UserNotFound(Exception):
     pass
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, message: str):
+        self.message = message
+
+
+class InvalidImage(Exception):
+    pass
+
+
+class UnsupportedFileFormat(Exception):
+    pass
+
+
+class InvalidFileEncoding(Exception):
+    pass
@@ -1,14 +1,49 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from cart.handlers import router as cart_router
+from cart.reservations import run_reservation_sweeper
+from config import MAX_IMPORT_SIZE
 from products.handlers import router as product_router
 from users.handlers import router as user_router
 from comments.handlers import router as comment_router
+from storage.handlers import router as image_router
+from products.autocomplete import autocomplete_index, run_autocomplete_rebuilder
+from products.stats import run_stats_flusher
+from storage.cleanup import run_deletion_worker, run_orphan_sweeper
+from storage.uploads import UploadSizeLimit
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await autocomplete_index.build()
+    except Exception:
+        # индекс заполнится при следующей перестройке
+        logger.exception("autocomplete index build failed")
+    background_tasks = [
+        asyncio.create_task(run_deletion_worker()),
+        asyncio.create_task(run_orphan_sweeper()),
+        asyncio.create_task(run_stats_flusher()),
+        asyncio.create_task(run_autocomplete_rebuilder()),
+        asyncio.create_task(run_reservation_sweeper()),
+    ]
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(UploadSizeLimit, path_limits={"/products/import": MAX_IMPORT_SIZE})
 
 app.include_router(comment_router)
 app.include_router(cart_router)
 app.include_router(product_router)
 app.include_router(user_router)
+app.include_router(image_router)
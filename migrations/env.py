@@ -13,6 +13,7 @@ from security import models
 from products import models
 from cart import models
 from comments import models
+from storage import models
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,37 @@
+"""content addressed images
+
+Revision ID: 0714f2bc42a2
+Revises: 5f9ebf1e592e
+Create Date: 2026-10-18 13:27:05.180644
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0714f2bc42a2"
+down_revision: Union[str, None] = "5f9ebf1e592e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "product_images", sa.Column("content_hash", sa.String(length=64), nullable=True)
+    )
+    op.add_column("product_images", sa.Column("variants", sa.JSON(), nullable=True))
+    op.create_index(
+        op.f("ix_product_images_content_hash"),
+        "product_images",
+        ["content_hash"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_product_images_content_hash"), table_name="product_images")
+    op.drop_column("product_images", "variants")
+    op.drop_column("product_images", "content_hash")
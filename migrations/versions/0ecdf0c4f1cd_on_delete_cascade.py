@@ -0,0 +1,44 @@
+"""on delete cascade
+
+Revision ID: 0ecdf0c4f1cd
+Revises: 29d8c00718d6
+Create Date: 2026-10-18 17:12:53.330471
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0ecdf0c4f1cd"
+down_revision: Union[str, None] = "29d8c00718d6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (таблица, столбец, ссылка) для внешних ключей, созданных без ON DELETE
+FOREIGN_KEYS = [
+    ("carts", "user_id", "users"),
+    ("comments", "user_id", "users"),
+    ("comments", "product_id", "products"),
+    ("product_images", "product_id", "products"),
+    ("refresh_tokens", "user_id", "users"),
+]
+
+
+def _recreate_foreign_keys(ondelete: Union[str, None]) -> None:
+    for table, column, referent in FOREIGN_KEYS:
+        name = f"{table}_{column}_fkey"
+        op.drop_constraint(name, table, type_="foreignkey")
+        op.create_foreign_key(
+            name, table, referent, [column], ["id"], ondelete=ondelete
+        )
+
+
+def upgrade() -> None:
+    _recreate_foreign_keys("CASCADE")
+
+
+def downgrade() -> None:
+    _recreate_foreign_keys(None)
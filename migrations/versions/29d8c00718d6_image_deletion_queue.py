@@ -0,0 +1,51 @@
+"""image deletion queue
+
+Revision ID: 29d8c00718d6
+Revises: 0714f2bc42a2
+Create Date: 2026-10-18 15:40:12.904117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "29d8c00718d6"
+down_revision: Union[str, None] = "0714f2bc42a2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "image_deletions",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("path", sa.String(), nullable=False),
+        sa.Column(
+            "enqueued_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "not_before",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    # проверка ссылок перед удалением ищет оригиналы по image_url
+    op.create_index(
+        op.f("ix_product_images_image_url"),
+        "product_images",
+        ["image_url"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_product_images_image_url"), table_name="product_images")
+    op.drop_table("image_deletions")
@@ -0,0 +1,89 @@
+"""category product count
+
+Revision ID: 4d0b2296f631
+Revises: 6ccb08386352
+Create Date: 2026-10-18 21:14:37.641902
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "4d0b2296f631"
+down_revision: Union[str, None] = "6ccb08386352"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "categories",
+        sa.Column("product_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.execute("""
+        UPDATE categories c SET product_count = p.n
+        FROM (SELECT category_id, count(*) AS n FROM products GROUP BY category_id) p
+        WHERE c.id = p.category_id
+        """)
+
+    # вставки и удаления считаются на уровне оператора через transition tables,
+    # чтобы массовый импорт обновлял строку категории один раз, а не на каждый товар
+    op.execute("""
+        CREATE FUNCTION categories_count_inserted() RETURNS trigger AS $$
+        BEGIN
+            UPDATE categories c SET product_count = c.product_count + d.n
+            FROM (SELECT category_id, count(*) AS n FROM new_rows GROUP BY category_id) d
+            WHERE c.id = d.category_id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """)
+    op.execute("""
+        CREATE FUNCTION categories_count_deleted() RETURNS trigger AS $$
+        BEGIN
+            UPDATE categories c SET product_count = c.product_count - d.n
+            FROM (SELECT category_id, count(*) AS n FROM old_rows GROUP BY category_id) d
+            WHERE c.id = d.category_id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """)
+    op.execute("""
+        CREATE FUNCTION categories_count_moved() RETURNS trigger AS $$
+        BEGIN
+            UPDATE categories SET product_count = product_count - 1
+            WHERE id = OLD.category_id;
+            UPDATE categories SET product_count = product_count + 1
+            WHERE id = NEW.category_id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """)
+    op.execute("""
+        CREATE TRIGGER products_count_inserted AFTER INSERT ON products
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION categories_count_inserted()
+        """)
+    op.execute("""
+        CREATE TRIGGER products_count_deleted AFTER DELETE ON products
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION categories_count_deleted()
+        """)
+    op.execute("""
+        CREATE TRIGGER products_count_moved AFTER UPDATE OF category_id ON products
+        FOR EACH ROW WHEN (OLD.category_id IS DISTINCT FROM NEW.category_id)
+        EXECUTE FUNCTION categories_count_moved()
+        """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER products_count_moved ON products")
+    op.execute("DROP TRIGGER products_count_deleted ON products")
+    op.execute("DROP TRIGGER products_count_inserted ON products")
+    op.execute("DROP FUNCTION categories_count_moved()")
+    op.execute("DROP FUNCTION categories_count_deleted()")
+    op.execute("DROP FUNCTION categories_count_inserted()")
+    op.drop_column("categories", "product_count")
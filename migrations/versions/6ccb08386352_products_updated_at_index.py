@@ -0,0 +1,28 @@
+"""products updated_at index
+
+Revision ID: 6ccb08386352
+Revises: 0ecdf0c4f1cd
+Create Date: 2026-10-18 19:58:30.226115
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "6ccb08386352"
+down_revision: Union[str, None] = "0ecdf0c4f1cd"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        op.f("ix_products_updated_at"), "products", ["updated_at"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_products_updated_at"), table_name="products")
@@ -0,0 +1,60 @@
+"""category tree
+
+Revision ID: 8b3e51c0d7a4
+Revises: 4d0b2296f631
+Create Date: 2026-10-18 22:02:11.318447
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "8b3e51c0d7a4"
+down_revision: Union[str, None] = "4d0b2296f631"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("categories", sa.Column("parent_id", sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        "categories_parent_id_fkey", "categories", "categories", ["parent_id"], ["id"]
+    )
+    op.create_table(
+        "category_closure",
+        sa.Column("ancestor_id", sa.Integer(), nullable=False),
+        sa.Column("descendant_id", sa.Integer(), nullable=False),
+        sa.Column("depth", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["ancestor_id"], ["categories.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(
+            ["descendant_id"], ["categories.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("ancestor_id", "descendant_id"),
+    )
+    op.create_index(
+        op.f("ix_category_closure_descendant_id"),
+        "category_closure",
+        ["descendant_id"],
+        unique=False,
+    )
+    # существующие категории становятся корнями: у каждой только запись на себя
+    op.execute(
+        "INSERT INTO category_closure (ancestor_id, descendant_id, depth) "
+        "SELECT id, id, 0 FROM categories"
+    )
+    op.create_index(
+        "ix_products_category_id_id", "products", ["category_id", "id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_products_category_id_id", table_name="products")
+    op.drop_index(
+        op.f("ix_category_closure_descendant_id"), table_name="category_closure"
+    )
+    op.drop_table("category_closure")
+    op.drop_constraint("categories_parent_id_fkey", "categories", type_="foreignkey")
+    op.drop_column("categories", "parent_id")
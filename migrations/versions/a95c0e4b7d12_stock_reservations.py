@@ -0,0 +1,148 @@
+"""stock reservations
+
+Revision ID: a95c0e4b7d12
+Revises: f3d8b61a04c9
+Create Date: 2026-10-19 00:27:13.640218
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a95c0e4b7d12"
+down_revision: Union[str, None] = "f3d8b61a04c9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# сумма удержаний по товару лежит в product_reservations, а не в products:
+# строки блокируются FOR NO KEY UPDATE в порядке product_id, как при оформлении
+# заказа, чтобы пачка удержаний и checkout не ждали друг друга крест-накрест.
+# горячая строка отдельно от товара не мешает ни правке товара, ни проверкам
+# внешних ключей (FOR KEY SHARE) при вставке позиций и удержаний
+RESERVATIONS_FUNCTIONS = {
+    "reservations_inserted": """
+        BEGIN
+            PERFORM 1 FROM product_reservations
+            WHERE product_id IN (SELECT product_id FROM new_rows)
+            ORDER BY product_id FOR NO KEY UPDATE;
+            UPDATE product_reservations r SET reserved = r.reserved + d.n
+            FROM (SELECT product_id, sum(quantity) AS n FROM new_rows GROUP BY product_id) d
+            WHERE r.product_id = d.product_id;
+            RETURN NULL;
+        END
+    """,
+    "reservations_deleted": """
+        BEGIN
+            PERFORM 1 FROM product_reservations
+            WHERE product_id IN (SELECT product_id FROM old_rows)
+            ORDER BY product_id FOR NO KEY UPDATE;
+            UPDATE product_reservations r SET reserved = r.reserved - d.n
+            FROM (SELECT product_id, sum(quantity) AS n FROM old_rows GROUP BY product_id) d
+            WHERE r.product_id = d.product_id;
+            RETURN NULL;
+        END
+    """,
+    "reservations_updated": """
+        BEGIN
+            PERFORM 1 FROM product_reservations
+            WHERE product_id IN (SELECT product_id FROM new_rows)
+            ORDER BY product_id FOR NO KEY UPDATE;
+            UPDATE product_reservations r SET reserved = r.reserved + d.n
+            FROM (
+                SELECT product_id, sum(quantity) AS n FROM (
+                    SELECT product_id, quantity FROM new_rows
+                    UNION ALL
+                    SELECT product_id, -quantity FROM old_rows
+                ) q
+                GROUP BY product_id
+            ) d
+            WHERE r.product_id = d.product_id AND d.n <> 0;
+            RETURN NULL;
+        END
+    """,
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        "product_reservations",
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("reserved", sa.Integer(), server_default="0", nullable=False),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("product_id"),
+    )
+    op.execute("INSERT INTO product_reservations (product_id) SELECT id FROM products")
+    op.create_table(
+        "stock_reservations",
+        sa.Column("cart_item_id", sa.Integer(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["cart_item_id"], ["cart_items.id"], ondelete="CASCADE"
+        ),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("cart_item_id"),
+    )
+    op.create_index(
+        op.f("ix_stock_reservations_expires_at"),
+        "stock_reservations",
+        ["expires_at"],
+        unique=False,
+    )
+
+    # как и у product_stats, строка есть у каждого товара: триггеры удержаний
+    # делают чистый UPDATE, а оформление заказа блокирует ее внутренним соединением
+    op.execute("""
+        CREATE FUNCTION product_reservations_inserted() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO product_reservations (product_id) SELECT id FROM new_rows;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """)
+    op.execute("""
+        CREATE TRIGGER products_reservations_inserted AFTER INSERT ON products
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION product_reservations_inserted()
+        """)
+
+    for name, body in RESERVATIONS_FUNCTIONS.items():
+        op.execute(
+            f"CREATE FUNCTION {name}() RETURNS trigger AS $${body}$$ LANGUAGE plpgsql"
+        )
+    op.execute("""
+        CREATE TRIGGER stock_reservations_inserted AFTER INSERT ON stock_reservations
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION reservations_inserted()
+        """)
+    op.execute("""
+        CREATE TRIGGER stock_reservations_deleted AFTER DELETE ON stock_reservations
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION reservations_deleted()
+        """)
+    op.execute("""
+        CREATE TRIGGER stock_reservations_updated AFTER UPDATE ON stock_reservations
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION reservations_updated()
+        """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER stock_reservations_updated ON stock_reservations")
+    op.execute("DROP TRIGGER stock_reservations_deleted ON stock_reservations")
+    op.execute("DROP TRIGGER stock_reservations_inserted ON stock_reservations")
+    op.execute("DROP FUNCTION reservations_updated()")
+    op.execute("DROP FUNCTION reservations_deleted()")
+    op.execute("DROP FUNCTION reservations_inserted()")
+    op.execute("DROP TRIGGER products_reservations_inserted ON products")
+    op.execute("DROP FUNCTION product_reservations_inserted()")
+    op.drop_index(
+        op.f("ix_stock_reservations_expires_at"), table_name="stock_reservations"
+    )
+    op.drop_table("stock_reservations")
+    op.drop_table("product_reservations")
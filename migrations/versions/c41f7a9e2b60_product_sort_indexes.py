@@ -0,0 +1,44 @@
+"""product sort indexes
+
+Revision ID: c41f7a9e2b60
+Revises: 8b3e51c0d7a4
+Create Date: 2026-10-18 22:31:48.904215
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c41f7a9e2b60"
+down_revision: Union[str, None] = "8b3e51c0d7a4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_products_category_id_price_id",
+        "products",
+        ["category_id", "price", "id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_products_category_id_created_at_id",
+        "products",
+        ["category_id", "created_at", "id"],
+        unique=False,
+    )
+    op.create_index("ix_products_price_id", "products", ["price", "id"], unique=False)
+    op.create_index(
+        "ix_products_created_at_id", "products", ["created_at", "id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_products_created_at_id", table_name="products")
+    op.drop_index("ix_products_price_id", table_name="products")
+    op.drop_index("ix_products_category_id_created_at_id", table_name="products")
+    op.drop_index("ix_products_category_id_price_id", table_name="products")
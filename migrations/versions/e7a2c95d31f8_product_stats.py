@@ -0,0 +1,65 @@
+"""product stats
+
+Revision ID: e7a2c95d31f8
+Revises: c41f7a9e2b60
+Create Date: 2026-10-18 23:05:27.117630
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e7a2c95d31f8"
+down_revision: Union[str, None] = "c41f7a9e2b60"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "product_stats",
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("views", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("sales", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column(
+            "popularity",
+            sa.BigInteger(),
+            sa.Computed("views + 10 * sales", persisted=True),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("product_id"),
+    )
+    op.create_index(
+        "ix_product_stats_popularity_product_id",
+        "product_stats",
+        ["popularity", "product_id"],
+        unique=False,
+    )
+    op.execute("INSERT INTO product_stats (product_id) SELECT id FROM products")
+
+    # у каждого товара есть строка статистики, поэтому сброс счетчиков - чистый
+    # UPDATE, а сортировка по популярности - внутреннее соединение
+    op.execute("""
+        CREATE FUNCTION product_stats_inserted() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO product_stats (product_id) SELECT id FROM new_rows;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """)
+    op.execute("""
+        CREATE TRIGGER products_stats_inserted AFTER INSERT ON products
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION product_stats_inserted()
+        """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER products_stats_inserted ON products")
+    op.execute("DROP FUNCTION product_stats_inserted()")
+    op.drop_index("ix_product_stats_popularity_product_id", table_name="product_stats")
+    op.drop_table("product_stats")
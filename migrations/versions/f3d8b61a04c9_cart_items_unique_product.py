@@ -0,0 +1,44 @@
+"""cart items unique product
+
+Revision ID: f3d8b61a04c9
+Revises: e7a2c95d31f8
+Create Date: 2026-10-18 23:48:02.551973
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "f3d8b61a04c9"
+down_revision: Union[str, None] = "e7a2c95d31f8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # повторные позиции одного товара сливаются в первую
+    op.execute("""
+        UPDATE cart_items c SET quantity = d.quantity
+        FROM (
+            SELECT min(id) AS id, sum(quantity) AS quantity
+            FROM cart_items GROUP BY cart_id, product_id HAVING count(*) > 1
+        ) d
+        WHERE c.id = d.id
+        """)
+    op.execute("""
+        DELETE FROM cart_items c USING cart_items k
+        WHERE c.cart_id = k.cart_id AND c.product_id = k.product_id AND c.id > k.id
+        """)
+    op.create_index(
+        "ix_cart_items_cart_id_product_id",
+        "cart_items",
+        ["cart_id", "product_id"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_cart_items_cart_id_product_id", table_name="cart_items")
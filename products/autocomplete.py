@@ -0,0 +1,276 @@
+import asyncio
+import heapq
+import logging
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from config import (
+    AUTOCOMPLETE_REBUILD_INTERVAL,
+    EXPORT_FETCH_SIZE,
+    MAX_AUTOCOMPLETE_LIMIT,
+)
+from database import new_session
+from products.models import Product, ProductStats
+
+logger = logging.getLogger(__name__)
+
+# ответы на частые префиксы запоминаются до следующего изменения индекса
+_MAX_CACHED_PREFIXES = 4096
+# префиксы до такой длины совпадают с большой частью каталога: для них лучшие
+# товары хранятся готовыми и обновляются вместе с популярностью
+_TOP_PREFIX_LENGTH = 2
+
+
+def normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def _suffixes(normalized: str) -> list[str]:
+    """название с каждого слова: "iphone 15 pro" ищется и по "pro" """
+    words = normalized.split(" ")
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+def _build(
+    rows: list[tuple[int, str, int]],
+) -> tuple[list[tuple[str, int]], dict[int, str], dict[int, int], dict[str, list[int]]]:
+    """
+    массив суффиксов, названия, популярность и списки лучших для коротких
+    префиксов по строкам (id, название, популярность). чистая функция для потока
+    """
+    entries, names, popularity = [], {}, {}
+    for product_id, name, score in rows:
+        names[product_id] = name
+        popularity[product_id] = score
+        entries.extend((suffix, product_id) for suffix in _suffixes(normalize(name)))
+    entries.sort()
+
+    candidates: dict[str, set[int]] = {}
+    for suffix, product_id in entries:
+        for length in range(1, min(len(suffix), _TOP_PREFIX_LENGTH) + 1):
+            candidates.setdefault(suffix[:length], set()).add(product_id)
+    top = {
+        prefix: heapq.nsmallest(
+            MAX_AUTOCOMPLETE_LIMIT,
+            product_ids,
+            key=lambda pid: (-popularity[pid], pid),
+        )
+        for prefix, product_ids in candidates.items()
+    }
+    return entries, names, popularity, top
+
+
+def _short_prefixes(name: str) -> set[str]:
+    return {
+        suffix[:length]
+        for suffix in _suffixes(normalize(name))
+        for length in range(1, _TOP_PREFIX_LENGTH + 1)
+    }
+
+
+class AutocompleteIndex:
+    """
+    подсказки по началу слов в названиях товаров. отсортированный массив пар
+    (нормализованный суффикс названия, id товара): совпадения с префиксом идут
+    подряд и находятся двумя bisect, среди них берутся самые популярные. для
+    коротких префиксов совпадений слишком много, их лучшие товары хранятся в
+    _top: счетчики популярности только растут, поэтому список обновляется
+    вставкой, а пересчитывается (_stale_top) только после удаления товара.
+    изменения во время build записываются в _pending и повторяются на новом
+    индексе, иначе подмена их бы потеряла
+    """
+
+    def __init__(self):
+        self._entries: list[tuple[str, int]] = []
+        self._names: dict[int, str] = {}
+        self._popularity: dict[int, int] = {}
+        self._cache: dict[tuple[str, int], list[dict]] = {}
+        self._top: dict[str, list[int]] = {}
+        self._stale_top: set[str] = set()
+        self._pending: Optional[list[tuple[str, tuple]]] = None
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _rank(self, product_id: int) -> tuple[int, int]:
+        return -self._popularity[product_id], product_id
+
+    def _record(self, method: str, *args) -> None:
+        if self._pending is not None:
+            self._pending.append((method, args))
+
+    def add(self, product_id: int, name: str, popularity: Optional[int] = None) -> None:
+        """добавляет товар или обновляет его название"""
+        self._record("add", product_id, name, popularity)
+        if product_id in self._names:
+            self._unlink(product_id)
+        self._set_product(product_id, name, popularity)
+        for suffix in _suffixes(normalize(name)):
+            insort(self._entries, (suffix, product_id))
+        self._offer(product_id)
+        self._cache.clear()
+
+    def add_many(self, products: list[tuple[int, str, Optional[int]]]) -> None:
+        """
+        пачка (id, название, популярность), например после импорта: вместо
+        insort на каждый суффикс массив дополняется и сортируется один раз
+        """
+        self._record("add_many", products)
+        replaced = {product_id for product_id, _, _ in products} & self._names.keys()
+        if replaced:
+            for product_id in replaced:
+                self._forget_top(product_id)
+            self._entries = [
+                entry for entry in self._entries if entry[1] not in replaced
+            ]
+        added = []
+        for product_id, name, popularity in products:
+            self._set_product(product_id, name, popularity)
+            added.extend((suffix, product_id) for suffix in _suffixes(normalize(name)))
+        # два отсортированных отрезка timsort сливает за линейное время
+        added.sort()
+        self._entries.extend(added)
+        self._entries.sort()
+        for product_id, _, _ in products:
+            self._offer(product_id)
+        self._cache.clear()
+
+    def remove(self, product_id: int) -> None:
+        self._record("remove", product_id)
+        if product_id not in self._names:
+            return
+        self._unlink(product_id)
+        del self._names[product_id]
+        self._popularity.pop(product_id, None)
+        self._cache.clear()
+
+    def add_popularity(self, deltas: dict[int, int]) -> None:
+        self._record("add_popularity", deltas)
+        for product_id, delta in deltas.items():
+            if product_id in self._names:
+                self._popularity[product_id] += delta
+                if delta >= 0:
+                    self._offer(product_id)
+                else:
+                    self._forget_top(product_id)
+        if deltas:
+            self._cache.clear()
+
+    def _set_product(
+        self, product_id: int, name: str, popularity: Optional[int]
+    ) -> None:
+        self._names[product_id] = name
+        if popularity is not None or product_id not in self._popularity:
+            self._popularity[product_id] = popularity or 0
+
+    def _unlink(self, product_id: int) -> None:
+        self._forget_top(product_id)
+        for suffix in _suffixes(normalize(self._names[product_id])):
+            position = bisect_left(self._entries, (suffix, product_id))
+            if self._entries[position : position + 1] == [(suffix, product_id)]:
+                del self._entries[position]
+
+    def _offer(self, product_id: int) -> None:
+        """ставит товар в списки лучших его коротких префиксов, если он туда проходит"""
+        rank = self._rank(product_id)
+        for prefix in _short_prefixes(self._names[product_id]):
+            if prefix in self._stale_top:
+                continue
+            top = self._top.setdefault(prefix, [])
+            if product_id not in top:
+                if len(top) >= MAX_AUTOCOMPLETE_LIMIT and rank > self._rank(top[-1]):
+                    continue
+                top.append(product_id)
+            top.sort(key=self._rank)
+            del top[MAX_AUTOCOMPLETE_LIMIT:]
+
+    def _forget_top(self, product_id: int) -> None:
+        """следующий за товаром кандидат неизвестен: список пересчитается при чтении"""
+        for prefix in _short_prefixes(self._names[product_id]):
+            if product_id in self._top.get(prefix, ()):
+                self._stale_top.add(prefix)
+
+    def _scan(self, prefix: str, limit: int) -> list[int]:
+        start = bisect_left(self._entries, (prefix,))
+        end = bisect_left(self._entries, (prefix + "\U0010ffff",), start)
+        matches = {product_id for _, product_id in self._entries[start:end]}
+        return heapq.nsmallest(limit, matches, key=self._rank)
+
+    def suggest(self, prefix: str, limit: int = 10) -> list[dict]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        if len(prefix) <= _TOP_PREFIX_LENGTH and limit <= MAX_AUTOCOMPLETE_LIMIT:
+            if prefix in self._stale_top:
+                self._top[prefix] = self._scan(prefix, MAX_AUTOCOMPLETE_LIMIT)
+                self._stale_top.discard(prefix)
+            best = self._top.get(prefix, [])[:limit]
+            return [{"id": pid, "name": self._names[pid]} for pid in best]
+
+        cache_key = (prefix, limit)
+        if cache_key in self._cache:
+            return self._cache[cache_key]
+
+        best = self._scan(prefix, limit)
+        suggestions = [{"id": pid, "name": self._names[pid]} for pid in best]
+
+        if len(self._cache) >= _MAX_CACHED_PREFIXES:
+            self._cache.clear()
+        self._cache[cache_key] = suggestions
+        return suggestions
+
+    async def build(self, fetch_size: int = EXPORT_FETCH_SIZE) -> int:
+        """
+        читает все названия серверным курсором и подменяет индекс целиком.
+        в цикле событий идет только чтение, разбор и сортировка - в потоке.
+        возвращает число товаров
+        """
+        query = (
+            select(Product.id, Product.name, func.coalesce(ProductStats.popularity, 0))
+            .outerjoin(ProductStats, ProductStats.product_id == Product.id)
+            .execution_options(yield_per=fetch_size)
+        )
+        rows = []
+        # запись начинается до снимка запроса: изменение, закоммиченное прямо
+        # перед ним, повторится, и его популярность до следующей перестройки
+        # учтется дважды; это дешевле, чем потерять созданный или удаленный товар
+        self._pending = []
+        try:
+            async with new_session() as session:
+                result = await session.stream(query)
+                async for partition in result.partitions():
+                    rows.extend(partition)
+            entries, names, popularity, top = await asyncio.to_thread(_build, rows)
+        except BaseException:
+            self._pending = None
+            raise
+
+        pending, self._pending = self._pending, None
+        self._entries, self._names, self._popularity = entries, names, popularity
+        self._top, self._stale_top = top, set()
+        self._cache = {}
+        for method, args in pending:
+            getattr(self, method)(*args)
+        return len(names)
+
+    def stats(self) -> dict:
+        return {"products": len(self._names), "entries": len(self._entries)}
+
+
+autocomplete_index = AutocompleteIndex()
+
+
+async def run_autocomplete_rebuilder():
+    """
+    изменения из других воркеров сюда не приходят, поэтому индекс
+    периодически перестраивается целиком
+    """
+    while True:
+        await asyncio.sleep(AUTOCOMPLETE_REBUILD_INTERVAL)
+        try:
+            await autocomplete_index.build()
+        except Exception:
+            logger.exception("autocomplete index rebuild failed")
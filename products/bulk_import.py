@@ -0,0 +1,179 @@
+import asyncio
+import codecs
+import csv
+import json
+import os
+from itertools import islice
+from typing import BinaryIO, Iterator, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import IMPORT_BATCH_SIZE
+from exceptions import InvalidFileEncoding, UnsupportedFileFormat
+from products.autocomplete import autocomplete_index
+from products.category_cache import category_cache
+from products.counting import clear_count_cache
+from products.facets import clear_facet_cache
+from products.models import Category
+from products.schemas import ProductImportRow
+
+FILE_FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+STAGING_TABLE = "product_import_staging"
+STAGING_COLUMNS = ["row_number", "name", "description", "price", "stock", "category_id"]
+
+
+def detect_format(filename: Optional[str], file_format: Optional[str] = None) -> str:
+    """формат файла: явно переданный или по расширению"""
+    if file_format is None:
+        file_format = FILE_FORMATS.get(os.path.splitext(filename or "")[1].lower())
+    if file_format not in FILE_FORMATS.values():
+        raise UnsupportedFileFormat()
+    return file_format
+
+
+def _decode(file: BinaryIO) -> Iterator[str]:
+    try:
+        yield from codecs.iterdecode(file, "utf-8")
+    except UnicodeDecodeError as e:
+        raise InvalidFileEncoding() from e
+
+
+def _read_rows(file: BinaryIO, file_format: str) -> Iterator[tuple[int, object]]:
+    """
+    номер строки и сырые данные; битый json отдается как исключение, файл не в
+    utf-8 прерывает импорт с InvalidFileEncoding
+    """
+    lines = _decode(file)
+    if file_format == "csv":
+        # номер строки данных без учета заголовка
+        for row_number, row in enumerate(csv.DictReader(lines), start=1):
+            yield row_number, row
+        return
+
+    row_number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except ValueError as e:
+            yield row_number, e
+
+
+def _validate(raw) -> tuple[Optional[ProductImportRow], list[str]]:
+    if isinstance(raw, Exception):
+        return None, [f"invalid json: {raw}"]
+    if not isinstance(raw, dict):
+        return None, ["row must be an object"]
+    # в csv пустая ячейка - это пустая строка, а не отсутствие значения
+    raw = {key: value for key, value in raw.items() if key is not None and value != ""}
+    try:
+        return ProductImportRow.model_validate(raw), []
+    except ValidationError as e:
+        return None, [
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+            for error in e.errors()
+        ]
+
+
+def _prepare_batch(
+    rows: Iterator[tuple[int, object]],
+    batch_size: int,
+    category_ids: set[int],
+    category_by_name: dict[str, int],
+) -> tuple[list[tuple], list[dict], int]:
+    """
+    читает и проверяет следующую пачку строк: записи для staging-таблицы,
+    ошибки по номерам строк и сколько строк прочитано
+    """
+    records, errors, row_count = [], [], 0
+    for row_number, raw in islice(rows, batch_size):
+        row_count += 1
+        row, row_errors = _validate(raw)
+        if row is not None:
+            category_id = row.category_id
+            if category_id is None and row.category is not None:
+                category_id = category_by_name.get(row.category.lower())
+            if category_id not in category_ids:
+                row_errors.append("category not found")
+        if row_errors:
+            errors.append({"row": row_number, "errors": row_errors})
+            continue
+        records.append(
+            (row_number, row.name, row.description, row.price, row.stock, category_id)
+        )
+    return records, errors, row_count
+
+
+async def _copy_to_staging(session: AsyncSession, records: list[tuple]) -> None:
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        STAGING_TABLE, records=records, columns=STAGING_COLUMNS
+    )
+
+
+async def orm_import_products(
+    session: AsyncSession,
+    file: BinaryIO,
+    file_format: str,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> dict:
+    """
+    массовая загрузка товаров из csv или ndjson. файл читается и проверяется
+    пачками вне event loop, корректные строки идут в staging-таблицу через COPY
+    и одним INSERT ... SELECT добавляются в products. строки не сверяются с
+    уже существующими товарами: повторный импорт того же файла создаст дубликаты.
+    возвращает отчет с ошибками по номерам строк
+    """
+    result = await session.execute(select(Category.id, Category.name))
+    categories = result.all()
+    category_ids = {category_id for category_id, _ in categories}
+    category_by_name = {name.lower(): category_id for category_id, name in categories}
+
+    await session.execute(
+        text(
+            f"CREATE TEMP TABLE {STAGING_TABLE} ("
+            "row_number integer, name text, description text, "
+            "price double precision, stock integer, category_id integer"
+            ") ON COMMIT DROP"
+        )
+    )
+
+    rows = _read_rows(file, file_format)
+    errors, staged = [], 0
+    while True:
+        # чтение, разбор и проверка пачки pydantic идут в потоке
+        records, batch_errors, row_count = await asyncio.to_thread(
+            _prepare_batch, rows, batch_size, category_ids, category_by_name
+        )
+        if not row_count:
+            break
+        errors.extend(batch_errors)
+        if records:
+            await _copy_to_staging(session, records)
+            staged += len(records)
+
+    result = await session.execute(
+        text(
+            "INSERT INTO products "
+            "(name, description, price, stock, category_id, created_at, updated_at) "
+            "SELECT name, description, price, stock, category_id, now(), now() "
+            f"FROM {STAGING_TABLE} ORDER BY row_number "
+            "RETURNING id, name"
+        )
+    )
+    inserted = result.all()
+    await session.commit()
+    clear_count_cache()
+    clear_facet_cache()
+    category_cache.invalidate()
+    autocomplete_index.add_many(
+        [(product_id, name, 0) for product_id, name in inserted]
+    )
+
+    return {"imported": staged, "failed": len(errors), "errors": errors}
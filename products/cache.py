@@ -0,0 +1,184 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from config import (
+    PRODUCT_CACHE_BACKEND,
+    PRODUCT_CACHE_SIZE,
+    PRODUCT_CACHE_TTL,
+    PRODUCT_CACHE_URL,
+)
+from products.models import Product
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+
+def product_to_dict(product: Product) -> dict:
+    """снимок загруженных столбцов товара, пригодный для json"""
+    data = {}
+    for column in Product.__table__.columns:
+        if column.key not in product.__dict__:
+            continue
+        value = product.__dict__[column.key]
+        data[column.key] = value.isoformat() if isinstance(value, datetime) else value
+    return data
+
+
+class ProductCache(ABC):
+    """общий интерфейс кэша товаров по id"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @abstractmethod
+    async def get(self, product_id: int) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def set(self, product_id: int, data: dict) -> None: ...
+
+    @abstractmethod
+    async def delete(self, *product_ids: int) -> None: ...
+
+    @abstractmethod
+    async def clear(self) -> None: ...
+
+    async def get_many(self, product_ids: list[int]) -> dict[int, dict]:
+        """найденные в кэше товары по id; внешние хранилища читают их одним запросом"""
+        found = {}
+        for product_id in product_ids:
+            data = await self.get(product_id)
+            if data is not None:
+                found[product_id] = data
+        return found
+
+    async def set_many(self, items: dict[int, dict]) -> None:
+        for product_id, data in items.items():
+            await self.set(product_id, data)
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class LRUProductCache(ProductCache):
+    """кэш в памяти процесса: вытесняет давно не читанные записи и просроченные"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+
+    async def get(self, product_id: int) -> Optional[dict]:
+        entry = self._entries.get(product_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, data = entry
+        if expires_at <= time.monotonic():
+            del self._entries[product_id]
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(product_id)
+        self.hits += 1
+        return data
+
+    async def set(self, product_id: int, data: dict) -> None:
+        self._entries[product_id] = (time.monotonic() + self.ttl, data)
+        self._entries.move_to_end(product_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, *product_ids: int) -> None:
+        for product_id in product_ids:
+            self._entries.pop(product_id, None)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {**super().stats(), "size": len(self._entries)}
+
+
+class KeyValueProductCache(ProductCache):
+    """
+    кэш во внешнем key-value хранилище (redis или совместимый клиент с
+    get/mget/set(ex=...)/delete/pipeline). общий для всех воркеров, вытеснением
+    занимается само хранилище
+    """
+
+    key_prefix = "product:"
+
+    def __init__(self, client, ttl: float = 60):
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+
+    def _key(self, product_id: int) -> str:
+        return f"{self.key_prefix}{product_id}"
+
+    async def get(self, product_id: int) -> Optional[dict]:
+        raw = await self.client.get(self._key(product_id))
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    async def set(self, product_id: int, data: dict) -> None:
+        await self.client.set(self._key(product_id), json.dumps(data), ex=self.ttl)
+
+    async def get_many(self, product_ids: list[int]) -> dict[int, dict]:
+        if not product_ids:
+            return {}
+        raws = await self.client.mget([self._key(pid) for pid in product_ids])
+        found = {pid: json.loads(raw) for pid, raw in zip(product_ids, raws) if raw}
+        self.hits += len(found)
+        self.misses += len(product_ids) - len(found)
+        return found
+
+    async def set_many(self, items: dict[int, dict]) -> None:
+        # у MSET нет срока жизни, поэтому SET EX отправляются одним пакетом
+        if not items:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for product_id, data in items.items():
+                pipe.set(self._key(product_id), json.dumps(data), ex=self.ttl)
+            await pipe.execute()
+
+    async def delete(self, *product_ids: int) -> None:
+        if product_ids:
+            await self.client.delete(*(self._key(pid) for pid in product_ids))
+
+    async def clear(self) -> None:
+        keys = [key async for key in self.client.scan_iter(f"{self.key_prefix}*")]
+        if keys:
+            await self.client.delete(*keys)
+
+
+def build_product_cache() -> ProductCache:
+    if PRODUCT_CACHE_BACKEND == "memory":
+        return LRUProductCache(max_size=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL)
+    if PRODUCT_CACHE_BACKEND == "redis":
+        if aioredis is None:
+            raise RuntimeError("PRODUCT_CACHE_BACKEND=redis requires the redis extra")
+        client = aioredis.from_url(PRODUCT_CACHE_URL, decode_responses=True)
+        return KeyValueProductCache(client, ttl=PRODUCT_CACHE_TTL)
+    raise ValueError(f"unknown product cache backend: {PRODUCT_CACHE_BACKEND}")
+
+
+product_cache = build_product_cache()
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import time
+from typing import NamedTuple
+
+from sqlalchemy import select
+
+from config import CATEGORY_SNAPSHOT_TTL
+from database import new_session
+from products.models import Category
+from products.singleflight import SingleFlight
+
+
+class CategorySnapshot(NamedTuple):
+    # готовые тела ответов GET /all-categories и GET /category-tree
+    body: bytes
+    etag: str
+    tree_body: bytes
+    tree_etag: str
+    version: int
+    built_at: float
+
+
+def _encode(data: dict) -> bytes:
+    return json.dumps(data, ensure_ascii=False).encode()
+
+
+def _etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def _build_tree(categories: list[dict]) -> list[dict]:
+    """вложенное дерево; subtree_product_count - товары категории и всех потомков"""
+    nodes = {
+        category["id"]: {
+            "id": category["id"],
+            "name": category["name"],
+            "product_count": category["product_count"],
+            "subtree_product_count": category["product_count"],
+            "children": [],
+        }
+        for category in categories
+    }
+    roots = []
+    for category in categories:
+        parent = nodes.get(category["parent_id"])
+        (parent["children"] if parent else roots).append(nodes[category["id"]])
+
+    def count(node: dict) -> int:
+        node["subtree_product_count"] += sum(count(c) for c in node["children"])
+        return node["subtree_product_count"]
+
+    for root in roots:
+        count(root)
+    return roots
+
+
+class CategoryCache:
+    """
+    список и дерево категорий с количеством товаров, собранные один раз и
+    отдаваемые из памяти. invalidate() вызывается после записей, меняющих категории или
+    количество товаров; снимок, собранный до invalidate(), не отдается
+    """
+
+    def __init__(self, ttl: float = CATEGORY_SNAPSHOT_TTL):
+        self.ttl = ttl
+        self._version = 0
+        self._snapshot = None
+        self._flight = SingleFlight()
+
+    def invalidate(self):
+        self._version += 1
+
+    async def get(self) -> CategorySnapshot:
+        snapshot = self._snapshot
+        if (
+            snapshot is None
+            or snapshot.version != self._version
+            or snapshot.built_at + self.ttl <= time.monotonic()
+        ):
+            snapshot = await self._flight.do(self._version, self._rebuild)
+        return snapshot
+
+    async def _rebuild(self) -> CategorySnapshot:
+        version = self._version
+        async with new_session() as session:
+            query = select(
+                Category.id, Category.name, Category.parent_id, Category.product_count
+            )
+            result = await session.execute(query.order_by(Category.id))
+            rows = result.all()
+
+        categories = [
+            {
+                "id": category_id,
+                "name": name,
+                "parent_id": parent_id,
+                "product_count": product_count,
+            }
+            for category_id, name, parent_id, product_count in rows
+        ]
+        body = _encode({"categories": categories})
+        tree_body = _encode({"tree": _build_tree(categories)})
+        snapshot = CategorySnapshot(
+            body, _etag(body), tree_body, _etag(tree_body), version, time.monotonic()
+        )
+        if version == self._version:
+            self._snapshot = snapshot
+        return snapshot
+
+
+category_cache = CategoryCache()
@@ -0,0 +1,82 @@
+import time
+
+from sqlalchemy import Select, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import APPROXIMATE_COUNT_THRESHOLD, COUNT_CACHE_TTL
+
+COUNT_EXACT = "exact"
+COUNT_CACHED = "cached"
+COUNT_APPROXIMATE = "approximate"
+COUNT_STRATEGIES = (COUNT_EXACT, COUNT_CACHED, COUNT_APPROXIMATE)
+
+_MAX_CACHED_COUNTS = 1024
+
+# ключ - текст запроса с параметрами, значение - (время истечения, total)
+_count_cache: dict[tuple, tuple[float, int]] = {}
+
+
+def _cache_key(query: Select) -> tuple:
+    compiled = query.compile()
+    return str(compiled), tuple(sorted(compiled.params.items(), key=str))
+
+
+def clear_count_cache():
+    _count_cache.clear()
+
+
+async def _exact_count(session: AsyncSession, query: Select) -> int:
+    count_query = select(func.count()).select_from(query.order_by(None).subquery())
+    result = await session.execute(count_query)
+    return result.scalar_one()
+
+
+async def _cached_count(session: AsyncSession, query: Select) -> int:
+    key = _cache_key(query)
+    now = time.monotonic()
+    cached = _count_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    total = await _exact_count(session, query)
+    if len(_count_cache) >= _MAX_CACHED_COUNTS:
+        for stale_key in [k for k, (exp, _) in _count_cache.items() if exp <= now]:
+            del _count_cache[stale_key]
+        if len(_count_cache) >= _MAX_CACHED_COUNTS:
+            _count_cache.clear()
+    _count_cache[key] = (now + COUNT_CACHE_TTL, total)
+    return total
+
+
+async def _estimated_count(session: AsyncSession, table_name: str) -> int:
+    """оценка числа строк по статистике планировщика (без сканирования таблицы)"""
+    query = text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:t)")
+    result = await session.execute(query, {"t": table_name})
+    estimate = result.scalar_one_or_none()
+    # -1 у таблиц, для которых еще не было ANALYZE
+    return estimate if estimate is not None else -1
+
+
+async def count_rows(
+    session: AsyncSession, query: Select, strategy: str = COUNT_EXACT
+) -> tuple[int, str]:
+    """
+    считает строки запроса через SELECT count(*) с теми же условиями.
+    возвращает total и стратегию, которая была применена на самом деле:
+    approximate работает только для запросов без фильтров по большой таблице,
+    иначе откатывается на cached
+    """
+    if strategy not in COUNT_STRATEGIES:
+        raise ValueError(f"unknown count strategy: {strategy}")
+
+    if strategy == COUNT_APPROXIMATE:
+        froms = query.get_final_froms()
+        if query.whereclause is None and len(froms) == 1:
+            estimate = await _estimated_count(session, froms[0].name)
+            if estimate >= APPROXIMATE_COUNT_THRESHOLD:
+                return estimate, COUNT_APPROXIMATE
+        strategy = COUNT_CACHED
+
+    if strategy == COUNT_CACHED:
+        return await _cached_count(session, query), COUNT_CACHED
+    return await _exact_count(session, query), COUNT_EXACT
@@ -0,0 +1,103 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import EXPORT_FETCH_SIZE
+from products.models import Category, Product, ProductImage
+from storage.image_store import image_url
+
+EXPORT_COLUMNS = [
+    "id",
+    "name",
+    "description",
+    "price",
+    "stock",
+    "category_id",
+    "category",
+    "created_at",
+    "updated_at",
+    "image_urls",
+]
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def _export_query(category_id: Optional[int], updated_since: Optional[datetime]):
+    images = (
+        select(
+            func.array_agg(aggregate_order_by(ProductImage.image_url, ProductImage.id))
+        )
+        .where(ProductImage.product_id == Product.id)
+        .scalar_subquery()
+    )
+    query = (
+        select(
+            Product.id,
+            Product.name,
+            Product.description,
+            Product.price,
+            Product.stock,
+            Product.category_id,
+            Category.name,
+            Product.created_at,
+            Product.updated_at,
+            images,
+        )
+        .join(Category, Category.id == Product.category_id)
+        .order_by(Product.id)
+    )
+    if category_id is not None:
+        query = query.where(Product.category_id == category_id)
+    if updated_since is not None:
+        query = query.where(Product.updated_at >= updated_since)
+    return query
+
+
+def _to_record(row) -> dict:
+    record = dict(zip(EXPORT_COLUMNS, row))
+    for key in ("created_at", "updated_at"):
+        if record[key] is not None:
+            record[key] = record[key].isoformat()
+    record["image_urls"] = [image_url(path) for path in record["image_urls"] or []]
+    return record
+
+
+def _encode(records: list[dict], file_format: str) -> str:
+    if file_format == "ndjson":
+        return "".join(
+            json.dumps(record, ensure_ascii=False) + "\n" for record in records
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in records:
+        record["image_urls"] = " ".join(record["image_urls"])
+        writer.writerow([record[column] for column in EXPORT_COLUMNS])
+    return buffer.getvalue()
+
+
+async def stream_products(
+    session: AsyncSession,
+    file_format: str,
+    category_id: Optional[int] = None,
+    updated_since: Optional[datetime] = None,
+    fetch_size: int = EXPORT_FETCH_SIZE,
+) -> AsyncIterator[str]:
+    """
+    выгрузка товаров с категорией и ссылками на изображения. строки читаются
+    серверным курсором по fetch_size штук, так что память не зависит от размера
+    каталога. updated_since позволяет выгружать только изменения
+    """
+    if file_format == "csv":
+        yield ",".join(EXPORT_COLUMNS) + "\r\n"
+
+    query = _export_query(category_id, updated_since).execution_options(
+        yield_per=fetch_size
+    )
+    result = await session.stream(query)
+    async for partition in result.partitions():
+        yield _encode([_to_record(row) for row in partition], file_format)
@@ -0,0 +1,120 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import case, func, literal_column, select, true, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import FACET_CACHE_SIZE, FACET_CACHE_TTL
+from products.filters import ProductFilter
+from products.models import CategoryClosure, Product
+
+# ключ - (категория, число корзин, значения фильтра), значение - (время истечения, фасеты)
+_facet_cache: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+
+
+def clear_facet_cache():
+    _facet_cache.clear()
+
+
+def _facet_query(
+    product_filter: ProductFilter, category_id: Optional[int], buckets: int
+):
+    """
+    один запрос с GROUPING SETS: строки с grouping(category_id) = 0 - число
+    товаров по категориям, остальные - по корзинам цены. границы корзин - min и
+    max цены среди отфильтрованных товаров
+    """
+    filtered = select(Product.category_id, Product.price)
+    if category_id is not None:
+        subtree = select(CategoryClosure.descendant_id).where(
+            CategoryClosure.ancestor_id == category_id
+        )
+        filtered = filtered.where(Product.category_id.in_(subtree))
+    filtered = product_filter.filter(filtered).cte("filtered")
+    bounds = select(
+        func.min(filtered.c.price).label("low"),
+        func.max(filtered.c.price).label("high"),
+    ).cte("bounds")
+
+    # выражение корзины повторяется в GROUP BY, поэтому число корзин вставлено
+    # литералом: с параметрами postgres не узнает в них одно и то же выражение.
+    # width_bucket отдает buckets + 1 для цены, равной high, и не принимает low = high
+    buckets_literal = literal_column(str(int(buckets)))
+    bucket = case(
+        (
+            bounds.c.high > bounds.c.low,
+            func.least(
+                func.width_bucket(
+                    filtered.c.price, bounds.c.low, bounds.c.high, buckets_literal
+                ),
+                buckets_literal,
+            ),
+        ),
+        else_=literal_column("1"),
+    )
+    return (
+        select(
+            func.grouping(filtered.c.category_id).label("by_price"),
+            filtered.c.category_id,
+            bucket.label("bucket"),
+            bounds.c.low,
+            bounds.c.high,
+            func.count().label("count"),
+        )
+        .select_from(filtered.join(bounds, true()))
+        .group_by(
+            func.grouping_sets(
+                tuple_(bounds.c.low, bounds.c.high, filtered.c.category_id),
+                tuple_(bounds.c.low, bounds.c.high, bucket),
+            )
+        )
+    )
+
+
+def _build_facets(rows, buckets: int) -> dict:
+    categories, price = [], []
+    for row in rows:
+        if not row.by_price:
+            categories.append({"category_id": row.category_id, "count": row.count})
+            continue
+        width = (row.high - row.low) / buckets
+        low = row.low + (row.bucket - 1) * width
+        high = row.high if row.bucket == buckets or not width else low + width
+        price.append({"min": low, "max": high, "count": row.count})
+
+    categories.sort(key=lambda facet: (-facet["count"], facet["category_id"]))
+    price.sort(key=lambda facet: facet["min"])
+    return {
+        "total": sum(facet["count"] for facet in categories),
+        "categories": categories,
+        "price": price,
+    }
+
+
+async def orm_get_facets(
+    session: AsyncSession,
+    product_filter: ProductFilter = ProductFilter(),
+    category_id: Optional[int] = None,
+    buckets: int = 10,
+) -> dict:
+    """
+    число товаров по категориям и гистограмма цен для текущего фильтра (и
+    поддерева категории, если она задана). частые сочетания фильтров берутся из
+    кэша в памяти на FACET_CACHE_TTL секунд
+    """
+    key = (category_id, buckets, tuple(sorted(product_filter.model_dump().items())))
+    now = time.monotonic()
+    cached = _facet_cache.get(key)
+    if cached and cached[0] > now:
+        _facet_cache.move_to_end(key)
+        return cached[1]
+
+    result = await session.execute(_facet_query(product_filter, category_id, buckets))
+    facets = _build_facets(result.all(), buckets)
+
+    _facet_cache[key] = (now + FACET_CACHE_TTL, facets)
+    _facet_cache.move_to_end(key)
+    while len(_facet_cache) > FACET_CACHE_SIZE:
+        _facet_cache.popitem(last=False)
+    return facets
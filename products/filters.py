@@ -12,3 +12,11 @@ class ProductFilter(Filter):
 
     class Constants(Filter.Constants):
         model = Product
+
+
+class ProductSearchFilter(Filter):
+    price__lte: Optional[float] = None
+    price__gte: Optional[float] = None
+
+    class Constants(Filter.Constants):
+        model = Product
@@ -1,30 +1,79 @@
-import os
-import uuid
+import asyncio
+import json
+from datetime import datetime
+from typing import Optional, Literal
 
-from fastapi import APIRouter, Form, UploadFile, HTTPException, status
+from fastapi import (
+    APIRouter,
+    Form,
+    UploadFile,
+    HTTPException,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
 from fastapi.params import Depends, File, Body, Query
 from fastapi_filter import FilterDepends
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_session
-from exceptions import CategoryNotFound, ProductNotFound
-from products.filters import ProductFilter
-from products.schemas import ProductUpdate
+from config import (
+    CATEGORY_PRODUCTS_COUNT_STRATEGY,
+    MAX_AUTOCOMPLETE_LIMIT,
+    MAX_FACET_BUCKETS,
+    MAX_PRODUCT_IDS,
+    PRODUCTS_COUNT_STRATEGY,
+    SINGLEFLIGHT_TIMEOUT,
+)
+from database import get_session, new_session
+from etag import etag_matches
+from exceptions import (
+    CategoryNotFound,
+    ProductNotFound,
+    InvalidCursor,
+    UploadTooLarge,
+    InvalidImage,
+    UnsupportedFileFormat,
+    InvalidFileEncoding,
+)
+from products.autocomplete import autocomplete_index
+from products.bulk_import import detect_format, orm_import_products
+from products.cache import product_cache
+from products.category_cache import category_cache
+from products.export import MEDIA_TYPES, stream_products
+from products.facets import orm_get_facets
+from products.filters import ProductFilter, ProductSearchFilter
+from products.schemas import ProductDetail, ProductUpdate
+from products.search import orm_search_products
+from products.singleflight import SingleFlight
+from products.sorting import ProductSort
+from products.stats import product_stats
 from products.queries import (
     orm_add_product,
     orm_add_new_category,
-    orm_get_categories,
     orm_get_products_by_category,
     orm_get_all_products,
-    orm_get_product_by_id,
+    orm_get_cached_product,
+    orm_get_cached_products,
+    orm_get_product_detail,
     orm_delete_product,
     orm_update_product,
+    product_loader,
 )
 from security.token import get_current_user
+from storage.image_store import discard_stored, store_uploads
 from users.models import User
 
 router = APIRouter(tags=["products"])
 
+# общие результаты одинаковых параллельных чтений; каждая загрузка открывает
+# свою сессию, потому что сессия первого запроса может закрыться раньше
+read_flight = SingleFlight(timeout=SINGLEFLIGHT_TIMEOUT)
+
+
+def _filter_key(product_filter: ProductFilter) -> str:
+    return json.dumps(product_filter.model_dump(), sort_keys=True, default=str)
+
 
 @router.post("/{add-new-product}")
 async def add_new_product(
@@ -49,23 +98,81 @@ async def add_new_product(
         "stock": stock,
         "category_id": category_id,
     }
-    image_paths = []
-    for image in images:
-        filename = f"{uuid.uuid4().hex}_{image.filename}"
-        file_path = f"images/{filename}"
-        os.makedirs("images", exist_ok=True)
-        with open(file_path, "wb") as buffer:
-            contents = await image.read()
-            buffer.write(contents)
-        image_paths.append(file_path)
+    try:
+        stored_images = await store_uploads(images)
+    except UploadTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=e.message
+        )
+    except InvalidImage:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="invalid image"
+        )
 
     try:
-        new_product = await orm_add_product(session, data, image_paths)
+        new_product = await orm_add_product(session, data, stored_images)
         return new_product
     except CategoryNotFound:
+        await discard_stored(stored_images)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="category not found"
         )
+    except Exception:
+        await discard_stored(stored_images)
+        raise
+
+
+@router.post("/products/import")
+async def import_products(
+    file: UploadFile = File(...),
+    file_format: Optional[str] = Query(None, description="csv or ndjson"),
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    if not user.is_seller:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="you are not seller"
+        )
+
+    try:
+        file_format = detect_format(file.filename, file_format)
+    except UnsupportedFileFormat:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="unsupported file format, use csv or ndjson",
+        )
+    try:
+        return await orm_import_products(session, file.file, file_format)
+    except InvalidFileEncoding:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="file must be utf-8 encoded",
+        )
+
+
+@router.get("/products/export")
+async def export_products(
+    file_format: Literal["ndjson", "csv"] = Query("ndjson"),
+    category_id: Optional[int] = Query(None),
+    updated_since: Optional[datetime] = Query(
+        None, description="only products updated at or after this time"
+    ),
+    user: User = Depends(get_current_user),
+):
+    if not user.is_seller:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="you are not seller"
+        )
+
+    # сессия зависимости закрывается до отправки тела, поэтому открываем свою
+    async def body():
+        async with new_session() as session:
+            async for chunk in stream_products(
+                session, file_format, category_id, updated_since
+            ):
+                yield chunk
+
+    return StreamingResponse(body(), media_type=MEDIA_TYPES[file_format])
 
 
 @router.patch("/{product.id}")
@@ -88,13 +195,112 @@ async def update_product(
         )
 
 
+@router.get("/products/search")
+async def search_products(
+    q: str = Query(..., min_length=1, description="search text"),
+    limit: int = Query(10, description="products per page"),
+    offset: int = Query(0, description="offset (products to skip)"),
+    search_filter: ProductSearchFilter = FilterDepends(ProductSearchFilter),
+    session: AsyncSession = Depends(get_session),
+):
+    rows = await orm_search_products(session, q, limit, offset, search_filter)
+    return {
+        "results": [{"product": product, "score": score} for product, score in rows],
+        "limit": limit,
+        "offset": offset,
+    }
+
+
+@router.get("/products/autocomplete")
+async def autocomplete_products(
+    q: str = Query(..., min_length=1, description="beginning of a word in the name"),
+    limit: int = Query(10, ge=1, le=MAX_AUTOCOMPLETE_LIMIT),
+):
+    return {"suggestions": autocomplete_index.suggest(q, limit)}
+
+
+@router.get("/products/facets")
+async def get_product_facets(
+    category_id: Optional[int] = Query(
+        None, description="count only this category and its subcategories"
+    ),
+    buckets: int = Query(10, ge=1, le=MAX_FACET_BUCKETS, description="price buckets"),
+    product_filter: ProductFilter = FilterDepends(ProductFilter),
+):
+    async def load():
+        async with new_session() as session:
+            return await orm_get_facets(session, product_filter, category_id, buckets)
+
+    key = ("facets", category_id, buckets, _filter_key(product_filter))
+    try:
+        return await read_flight.do(key, load)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="timed out"
+        )
+
+
+@router.get("/products/cache-stats")
+async def get_product_cache_stats():
+    return {
+        **product_cache.stats(),
+        "loader": product_loader.stats(),
+        "singleflight": read_flight.stats(),
+        "stats": product_stats.stats(),
+        "autocomplete": autocomplete_index.stats(),
+    }
+
+
+@router.get("/products")
+async def get_products_by_ids(
+    ids: str = Query(..., description="comma separated product ids"),
+    session: AsyncSession = Depends(get_session),
+):
+    try:
+        product_ids = list(dict.fromkeys(int(pid) for pid in ids.split(",") if pid))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="ids must be integers"
+        )
+    if len(product_ids) > MAX_PRODUCT_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"at most {MAX_PRODUCT_IDS} ids per request",
+        )
+
+    found = await orm_get_cached_products(session, product_ids)
+    return {
+        "products": [found[pid] for pid in product_ids if pid in found],
+        "missing": [pid for pid in product_ids if pid not in found],
+    }
+
+
 @router.get("/{product.id}")
-async def get_product_by_id(
+async def get_product_by_id(product_id: int):
+    try:
+        product = await read_flight.do(
+            ("product", product_id), lambda: orm_get_cached_product(product_id)
+        )
+        product_stats.record_view(product_id)
+        return product
+    except ProductNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="product not found"
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="timed out"
+        )
+
+
+@router.get("/products/{product_id}", response_model=ProductDetail)
+async def get_product_detail(
     product_id: int, session: AsyncSession = Depends(get_session)
 ):
     try:
-        product = await orm_get_product_by_id(session, product_id)
-        return product
+        detail = await orm_get_product_detail(session, product_id)
+        product_stats.record_view(product_id)
+        return detail
     except ProductNotFound:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="product not found"
@@ -107,28 +313,90 @@ async def get_products_by_category(
     session: AsyncSession = Depends(get_session),
     limit: int = 10,
     offset: int = 10,
+    cursor: Optional[str] = Query(None, description="next_cursor/prev_cursor"),
+    include_descendants: bool = Query(
+        False, description="include products of all nested categories"
+    ),
+    sort: Optional[ProductSort] = Query(
+        None, description="sort key, '-' prefix for descending"
+    ),
     product_filter: ProductFilter = FilterDepends(ProductFilter),
 ):
     try:
-        products, total = await orm_get_products_by_category(
-            session, category_id, limit, offset, product_filter
+        page = await orm_get_products_by_category(
+            session,
+            category_id,
+            limit,
+            offset,
+            product_filter,
+            cursor,
+            CATEGORY_PRODUCTS_COUNT_STRATEGY,
+            include_descendants,
+            sort,
         )
-        return {"products": products}
+        return {
+            "products": page.products,
+            "total": page.total,
+            "total_strategy": page.total_strategy,
+            "thumbnails": page.thumbnails,
+            "next_cursor": page.next_cursor,
+            "prev_cursor": page.prev_cursor,
+        }
     except CategoryNotFound:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="category not found"
         )
+    except InvalidCursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="invalid cursor"
+        )
 
 
 @router.get("/all-products")
 async def get_all_products(
-    session: AsyncSession = Depends(get_session),
     limit: int = Query(10, description="products per page"),
     offset: int = Query(0, description="offset (products to skip)"),
+    cursor: Optional[str] = Query(
+        None, description="next_cursor/prev_cursor, offset is ignored"
+    ),
+    sort: Optional[ProductSort] = Query(
+        None, description="sort key, '-' prefix for descending"
+    ),
     product_filter: ProductFilter = FilterDepends(ProductFilter),
 ):
-    products, total = await orm_get_all_products(session, limit, offset, product_filter)
-    return {"products": products, "total": total, "limit": limit, "offset": offset}
+    async def load():
+        async with new_session() as session:
+            return await orm_get_all_products(
+                session,
+                limit,
+                offset,
+                product_filter,
+                cursor,
+                PRODUCTS_COUNT_STRATEGY,
+                sort,
+            )
+
+    key = ("all-products", limit, offset, cursor, sort, _filter_key(product_filter))
+    try:
+        page = await read_flight.do(key, load)
+    except InvalidCursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="invalid cursor"
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="timed out"
+        )
+    return {
+        "products": page.products,
+        "total": page.total,
+        "total_strategy": page.total_strategy,
+        "thumbnails": page.thumbnails,
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": page.next_cursor,
+        "prev_cursor": page.prev_cursor,
+    }
 
 
 @router.delete("/delete-{product.id}")
@@ -152,13 +420,43 @@ async def delete_product(
 
 @router.post("/add-new-category")
 async def add_new_category(
-    category_name: str, session: AsyncSession = Depends(get_session)
+    category_name: str,
+    parent_id: Optional[int] = None,
+    session: AsyncSession = Depends(get_session),
 ):
-    new_category = await orm_add_new_category(session, category_name)
-    return new_category
+    try:
+        new_category = await orm_add_new_category(session, category_name, parent_id)
+        return new_category
+    except CategoryNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="parent category not found"
+        )
+
+
+async def _snapshot_response(request: Request, body: bytes, etag: str) -> Response:
+    headers = {"etag": etag, "cache-control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def _category_snapshot():
+    try:
+        return await read_flight.do(("all-categories",), category_cache.get)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="timed out"
+        )
 
 
 @router.get("/all-categories")
-async def get_categories(session: AsyncSession = Depends(get_session)):
-    categories = await orm_get_categories(session)
-    return {"categories": categories}
+async def get_categories(request: Request):
+    snapshot = await _category_snapshot()
+    return await _snapshot_response(request, snapshot.body, snapshot.etag)
+
+
+@router.get("/category-tree")
+async def get_category_tree(request: Request):
+    snapshot = await _category_snapshot()
+    return await _snapshot_response(request, snapshot.tree_body, snapshot.tree_etag)
@@ -0,0 +1,67 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+
+class BatchLoader:
+    """
+    склеивает одиночные запросы по ключу в пачки: все load(), вызванные за один
+    проход event loop, обслуживаются одним вызовом batch_fn. batch_fn получает
+    список ключей и возвращает словарь ключ -> значение; для ключей, которых
+    нет в словаре, load() поднимает исключение из missing_error()
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[list], Awaitable[dict]],
+        missing_error: Callable[[], Exception] = KeyError,
+        max_batch_size: int = 100,
+    ):
+        self.batch_fn = batch_fn
+        self.missing_error = missing_error
+        self.max_batch_size = max_batch_size
+        self._pending: dict[Hashable, asyncio.Future] = {}
+        self.batches = 0
+        self.loads = 0
+
+    async def load(self, key: Hashable):
+        self.loads += 1
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            if not self._pending:
+                loop.call_soon(self._dispatch)
+            future = loop.create_future()
+            # исключение могут не забрать, если все ожидающие отменены
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._pending[key] = future
+        # отмена одного ожидающего не должна отменять результат для остальных
+        return await asyncio.shield(future)
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        for start in range(0, len(keys), self.max_batch_size):
+            batch = {
+                key: pending[key] for key in keys[start : start + self.max_batch_size]
+            }
+            asyncio.create_task(self._run(batch))
+
+    async def _run(self, batch: dict[Hashable, asyncio.Future]):
+        self.batches += 1
+        try:
+            results = await self.batch_fn(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in batch.items():
+            if future.done():
+                continue
+            if key in results:
+                future.set_result(results[key])
+            else:
+                future.set_exception(self.missing_error())
+
+    def stats(self) -> dict:
+        return {"loads": self.loads, "batches": self.batches}
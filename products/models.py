@@ -1,14 +1,54 @@
 from typing import List
 
-from sqlalchemy import Integer, String, Text, Float, ForeignKey, DateTime, func
+from sqlalchemy import (
+    BigInteger,
+    Integer,
+    String,
+    Text,
+    Float,
+    ForeignKey,
+    DateTime,
+    func,
+    Computed,
+    Index,
+    JSON,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from comments.models import Comment
 from database import Base
 
+# вектор для полнотекстового поиска: название весомее описания
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+)
+
+# популярность: продажа весит как SALE_WEIGHT просмотров
+SALE_WEIGHT = 10
+POPULARITY_SQL = f"views + {SALE_WEIGHT} * sales"
+
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        Index("ix_products_category_id_id", "category_id", "id"),
+        # сортировки листингов (products.sorting): в категории и по всему каталогу
+        Index("ix_products_category_id_price_id", "category_id", "price", "id"),
+        Index(
+            "ix_products_category_id_created_at_id", "category_id", "created_at", "id"
+        ),
+        Index("ix_products_price_id", "price", "id"),
+        Index("ix_products_created_at_id", "created_at", "id"),
+        Index("ix_products_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_products_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, autoincrement=True, primary_key=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False)
@@ -20,16 +60,22 @@ class Product(Base):
     )
     created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
     updated_at: Mapped[DateTime] = mapped_column(
-        DateTime, default=func.now(), onupdate=func.now()
+        DateTime, default=func.now(), onupdate=func.now(), index=True
+    )
+    search_vector: Mapped[str] = mapped_column(
+        TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True), deferred=True
     )
 
     category: Mapped["Category"] = relationship(backref="products")
     images: Mapped[List["ProductImage"]] = relationship(
-        backref="product", lazy="dynamic", cascade="all, delete-orphan"
+        backref="product",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="ProductImage.id",
     )
 
     comments: Mapped[list["Comment"]] = relationship(
-        back_populates="product", cascade="all, delete-orphan"
+        back_populates="product", cascade="all, delete-orphan", passive_deletes=True
     )
 
 
@@ -37,8 +83,14 @@ class ProductImage(Base):
     __tablename__ = "product_images"
 
     id: Mapped[int] = mapped_column(Integer, autoincrement=True, primary_key=True)
-    product_id: Mapped[int] = mapped_column(Integer, ForeignKey("products.id"))
-    image_url: Mapped[str] = mapped_column(String)
+    product_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("products.id", ondelete="CASCADE")
+    )
+    image_url: Mapped[str] = mapped_column(String, index=True)
+    # sha256 содержимого; по нему считаются ссылки на общий файл
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=True, index=True)
+    # уменьшенные копии: {"thumb": путь, "medium": путь}
+    variants: Mapped[dict] = mapped_column(JSON, nullable=True)
 
 
 class Category(Base):
@@ -46,3 +98,68 @@ class Category(Base):
 
     id: Mapped[int] = mapped_column(Integer, autoincrement=True, primary_key=True)
     name: Mapped[str] = mapped_column(String(150), nullable=False)
+    parent_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("categories.id"), nullable=True
+    )
+    # поддерживается триггерами на products (миграция 4d0b2296f631)
+    product_count: Mapped[int] = mapped_column(
+        Integer, server_default="0", nullable=False
+    )
+
+
+class CategoryClosure(Base):
+    """
+    все пары (предок, потомок) дерева категорий, включая саму категорию с
+    depth=0. поддерево - это все descendant_id для заданного ancestor_id
+    """
+
+    __tablename__ = "category_closure"
+
+    ancestor_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True
+    )
+    descendant_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("categories.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+    depth: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class ProductStats(Base):
+    """
+    счетчики просмотров и продаж. строку для нового товара создает триггер на
+    products, значения накапливаются в памяти и сбрасываются пачкой
+    (products.stats), чтобы не блокировать строки products
+    """
+
+    __tablename__ = "product_stats"
+    __table_args__ = (
+        Index("ix_product_stats_popularity_product_id", "popularity", "product_id"),
+    )
+
+    product_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True
+    )
+    views: Mapped[int] = mapped_column(BigInteger, server_default="0", nullable=False)
+    sales: Mapped[int] = mapped_column(BigInteger, server_default="0", nullable=False)
+    popularity: Mapped[int] = mapped_column(
+        BigInteger, Computed(POPULARITY_SQL, persisted=True)
+    )
+
+
+class ProductReservation(Base):
+    """
+    сумма удержаний товара из корзин (cart.models.StockReservation), доступно к
+    покупке stock - reserved. строку для нового товара создает триггер на
+    products, значение поддерживают триггеры на stock_reservations. отдельная
+    таблица, чтобы удержания не блокировали и не переписывали строки products
+    """
+
+    __tablename__ = "product_reservations"
+
+    product_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True
+    )
+    reserved: Mapped[int] = mapped_column(Integer, server_default="0", nullable=False)
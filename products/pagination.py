@@ -0,0 +1,119 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, NamedTuple, Optional, Sequence
+
+from sqlalchemy import ColumnElement, Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from exceptions import InvalidCursor
+
+
+class ProductPage(NamedTuple):
+    products: Sequence
+    total: int
+    total_strategy: str
+    thumbnails: dict[int, str]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+
+def _key_names(key: Sequence[ColumnElement]) -> list[str]:
+    return [column.key for column in key]
+
+
+def encode_cursor(values: list, direction: str, names: list[str]) -> str:
+    """
+    упаковывает значения ключа последней строки в непрозрачную строку. имена
+    столбцов ключа сохраняются, чтобы курсор одной сортировки не приняли в другой
+    """
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    payload = json.dumps(
+        {"v": values, "d": direction, "k": names}, separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key: Sequence[ColumnElement]) -> tuple[list, str]:
+    """распаковывает курсор, выданный encode_cursor для того же ключа"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, direction, names = payload["v"], payload["d"], payload["k"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursor()
+
+    if direction not in ("next", "prev") or not isinstance(values, list):
+        raise InvalidCursor()
+    if names != _key_names(key) or len(values) != len(key):
+        raise InvalidCursor()
+    try:
+        values = [_from_json(column, value) for column, value in zip(key, values)]
+    except (ValueError, TypeError):
+        raise InvalidCursor()
+    return values, direction
+
+
+def _from_json(column: ColumnElement, value: Any) -> Any:
+    """в json даты хранятся строками, драйверу нужен datetime"""
+    if value is not None and column.type.python_type is datetime:
+        return datetime.fromisoformat(value)
+    return value
+
+
+async def paginate_keyset(
+    session: AsyncSession,
+    query: Select,
+    key: Sequence[ColumnElement],
+    limit: int,
+    cursor: Optional[str] = None,
+    offset: int = 0,
+    descending: bool = False,
+) -> tuple[Sequence, Optional[str], Optional[str]]:
+    """
+    постраничная выборка по ключу (key), последний столбец ключа должен быть
+    уникальным (id). столбцы ключа могут быть и из присоединенных таблиц: они
+    выбираются вместе со строкой. без курсора работает как обычный
+    limit/offset, но всегда возвращает курсоры, чтобы клиент мог перейти на
+    keyset с любой страницы
+    """
+    columns = tuple_(*key)
+    direction = "next"
+    if cursor:
+        values, direction = decode_cursor(cursor, key)
+        forward = direction == "next"
+        # при движении назад меняем порядок и сравнение, потом разворачиваем страницу
+        if forward != descending:
+            query = query.where(columns > tuple_(*values))
+        else:
+            query = query.where(columns < tuple_(*values))
+    else:
+        forward = True
+
+    reverse = forward == descending
+    query = query.order_by(*(column.desc() if reverse else column for column in key))
+    if not cursor and offset:
+        query = query.offset(offset)
+    query = query.add_columns(*key).limit(limit + 1)
+
+    result = await session.execute(query)
+    rows = list(result.all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not forward:
+        rows.reverse()
+
+    if not rows:
+        return rows, None, None
+
+    if forward:
+        has_next, has_prev = has_more, bool(cursor) or offset > 0
+    else:
+        has_next, has_prev = True, has_more
+
+    names = _key_names(key)
+    first, last = list(rows[0][1:]), list(rows[-1][1:])
+    next_cursor = encode_cursor(last, "next", names) if has_next else None
+    prev_cursor = encode_cursor(first, "prev", names) if has_prev else None
+    return [row[0] for row in rows], next_cursor, prev_cursor
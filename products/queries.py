@@ -1,15 +1,36 @@
-import os.path
+from typing import Optional
 
 from fastapi_filter.contrib.sqlalchemy import Filter
-from sqlalchemy import select
+from sqlalchemy import Integer, any_, bindparam, delete, insert, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
 
-from products.models import Product, ProductImage
-from products.models import Category
+from comments.models import Comment
+from config import PRODUCT_DETAIL_COMMENTS
+from database import new_session
+from products.models import Product, ProductImage, ProductReservation
+from products.models import Category, CategoryClosure
 
+from products.autocomplete import autocomplete_index
 from products.filters import ProductFilter
+from products.cache import product_cache, product_to_dict
+from products.category_cache import category_cache
+from products.counting import COUNT_EXACT, count_rows
+from products.loader import BatchLoader
+from products.pagination import ProductPage, paginate_keyset
+from products.sorting import apply_sort
+from products.schemas import (
+    CategoryRead,
+    CommentRead,
+    ProductDetail,
+    ProductImageRead,
+)
 
 from exceptions import CategoryNotFound, ProductNotFound
+from users.models import User
+from storage.image_store import StoredImage, image_url
+from storage.queries import orm_enqueue_product_images
 
 
 async def orm_get_category_by_id(session: AsyncSession, category_id: int):
@@ -21,7 +42,7 @@ async def orm_get_category_by_id(session: AsyncSession, category_id: int):
     return category
 
 
-async def orm_add_product(session: AsyncSession, data: dict, images: list[str]):
+async def orm_add_product(session: AsyncSession, data: dict, images: list[StoredImage]):
     """добавляет новый объект в бд"""
     new_product = Product(**data)
     category = await orm_get_category_by_id(session, new_product.category_id)
@@ -31,10 +52,17 @@ async def orm_add_product(session: AsyncSession, data: dict, images: list[str]):
     await session.flush()
 
     for image in images:
-        new_image = ProductImage(product_id=new_product.id, image_url=image)
+        new_image = ProductImage(
+            product_id=new_product.id,
+            image_url=image.path,
+            content_hash=image.content_hash,
+            variants=image.variants,
+        )
         session.add(new_image)
 
     await session.commit()
+    category_cache.invalidate()
+    autocomplete_index.add(new_product.id, new_product.name, 0)
     return new_product
 
 
@@ -48,29 +76,177 @@ async def orm_get_product_by_id(session: AsyncSession, product_id: int):
     return product
 
 
+async def orm_get_products_by_ids(
+    session: AsyncSession, product_ids: list[int]
+) -> list[Product]:
+    """товары по списку id одним запросом WHERE id = ANY(:ids)"""
+    if not product_ids:
+        return []
+    ids = bindparam("ids", list(product_ids), type_=ARRAY(Integer))
+    query = select(Product).where(Product.id == any_(ids))
+    result = await session.execute(query)
+    return list(result.scalars().all())
+
+
+async def _load_products(product_ids: list[int]) -> dict[int, dict]:
+    async with new_session() as session:
+        products = await orm_get_products_by_ids(session, product_ids)
+    return {product.id: product_to_dict(product) for product in products}
+
+
+# одиночные чтения товаров из разных запросов, попавшие в один проход
+# event loop, превращаются в один запрос к бд
+product_loader = BatchLoader(_load_products, missing_error=ProductNotFound)
+
+
+async def orm_get_cached_product(product_id: int) -> dict:
+    """товар по id через кэш, при промахе читает из бд и кладет в кэш"""
+    data = await product_cache.get(product_id)
+    if data is None:
+        data = await product_loader.load(product_id)
+        await product_cache.set(product_id, data)
+    return data
+
+
+async def orm_get_cached_products(
+    session: AsyncSession, product_ids: list[int]
+) -> dict[int, dict]:
+    """товары по списку id: что есть в кэше - из кэша, остальное одним запросом"""
+    found = await product_cache.get_many(product_ids)
+
+    missing = [product_id for product_id in product_ids if product_id not in found]
+    loaded = {
+        product.id: product_to_dict(product)
+        for product in await orm_get_products_by_ids(session, missing)
+    }
+    await product_cache.set_many(loaded)
+    found.update(loaded)
+    return found
+
+
+async def orm_get_product_detail(
+    session: AsyncSession,
+    product_id: int,
+    comments_limit: int = PRODUCT_DETAIL_COMMENTS,
+) -> ProductDetail:
+    """
+    карточка товара за три запроса независимо от числа изображений и
+    комментариев: товар с категорией, изображения (selectin) и первая
+    страница комментариев с авторами
+    """
+    query = (
+        select(Product, ProductReservation.reserved)
+        .outerjoin(ProductReservation, ProductReservation.product_id == Product.id)
+        .options(joinedload(Product.category), selectinload(Product.images))
+        .where(Product.id == product_id)
+    )
+    result = await session.execute(query)
+    row = result.one_or_none()
+    if not row:
+        raise ProductNotFound()
+    product, reserved = row
+
+    query = (
+        select(Comment, User.username)
+        .join(User, User.id == Comment.user_id)
+        .where(Comment.product_id == product_id)
+        .order_by(Comment.created_at.desc(), Comment.id.desc())
+        .limit(comments_limit + 1)
+    )
+    result = await session.execute(query)
+    rows = result.all()
+
+    return ProductDetail(
+        id=product.id,
+        name=product.name,
+        description=product.description,
+        price=product.price,
+        stock=product.stock,
+        available=max(product.stock - (reserved or 0), 0),
+        created_at=product.created_at,
+        updated_at=product.updated_at,
+        category=CategoryRead.model_validate(product.category),
+        images=[
+            ProductImageRead(
+                id=image.id,
+                url=image_url(image.image_url),
+                thumbnail_url=image_url(
+                    (image.variants or {}).get("thumb", image.image_url)
+                ),
+                variants={
+                    name: image_url(path)
+                    for name, path in (image.variants or {}).items()
+                },
+            )
+            for image in product.images
+        ],
+        comments=[
+            CommentRead(
+                id=comment.id,
+                user_id=comment.user_id,
+                username=username,
+                text=comment.text,
+                created_at=comment.created_at,
+            )
+            for comment, username in rows[:comments_limit]
+        ],
+        has_more_comments=len(rows) > comments_limit,
+    )
+
+
+async def orm_get_thumbnails(
+    session: AsyncSession, product_ids: list[int]
+) -> dict[int, str]:
+    """первое изображение каждого товара, по возможности уменьшенная копия"""
+    if not product_ids:
+        return {}
+    query = (
+        select(ProductImage.product_id, ProductImage.image_url, ProductImage.variants)
+        .where(ProductImage.product_id.in_(product_ids))
+        .distinct(ProductImage.product_id)
+        .order_by(ProductImage.product_id, ProductImage.id)
+    )
+    result = await session.execute(query)
+    return {
+        product_id: image_url((variants or {}).get("thumb", path))
+        for product_id, path, variants in result.all()
+    }
+
+
 async def orm_get_products_by_category(
     session: AsyncSession,
     category_id: int,
     limit: int = 10,
     offset: int = 0,
     product_filter: ProductFilter = ProductFilter(),
-):
+    cursor: Optional[str] = None,
+    count_strategy: str = COUNT_EXACT,
+    include_descendants: bool = False,
+    sort: Optional[str] = None,
+) -> ProductPage:
     category = await orm_get_category_by_id(session, category_id)
     if not category:
         raise CategoryNotFound()
 
-    query = select(Product).where(Product.category_id == category_id)
+    if include_descendants:
+        subtree = select(CategoryClosure.descendant_id).where(
+            CategoryClosure.ancestor_id == category_id
+        )
+        query = select(Product).where(Product.category_id.in_(subtree))
+    else:
+        query = select(Product).where(Product.category_id == category_id)
     query = product_filter.filter(query)
-    query = query.limit(limit).offset(offset)
+    total, total_strategy = await count_rows(session, query, count_strategy)
 
-    result = await session.execute(query)
-    products = result.scalars().all()
+    query, key, descending = apply_sort(query, sort)
+    products, next_cursor, prev_cursor = await paginate_keyset(
+        session, query, key, limit, cursor, offset, descending
+    )
+    thumbnails = await orm_get_thumbnails(session, [p.id for p in products])
 
-    count_query = select(Product).where(Product.category_id == category_id)
-    count_result = await session.execute(count_query)
-    total = len(count_result.scalars().all())
-
-    return products, total
+    return ProductPage(
+        products, total, total_strategy, thumbnails, next_cursor, prev_cursor
+    )
 
 
 async def orm_get_all_products(
@@ -78,19 +254,23 @@ async def orm_get_all_products(
     limit: int = 10,
     offset: int = 0,
     product_filter: Filter = ProductFilter(),
-):
+    cursor: Optional[str] = None,
+    count_strategy: str = COUNT_EXACT,
+    sort: Optional[str] = None,
+) -> ProductPage:
     query = select(Product)
     query = product_filter.filter(query)
-    query = query.limit(limit).offset(offset)
-
-    result = await session.execute(query)
-    products = result.scalars().all()
+    total, total_strategy = await count_rows(session, query, count_strategy)
 
-    count_query = select(Product)
-    count_result = await session.execute(count_query)
-    total = len(count_result.scalars().all())
+    query, key, descending = apply_sort(query, sort)
+    products, next_cursor, prev_cursor = await paginate_keyset(
+        session, query, key, limit, cursor, offset, descending
+    )
+    thumbnails = await orm_get_thumbnails(session, [p.id for p in products])
 
-    return products, total
+    return ProductPage(
+        products, total, total_strategy, thumbnails, next_cursor, prev_cursor
+    )
 
 
 async def orm_update_product(session: AsyncSession, product_id: int, data_to_update):
@@ -100,33 +280,59 @@ async def orm_update_product(session: AsyncSession, product_id: int, data_to_upd
 
     await session.commit()
     await session.refresh(product)
+    await product_cache.set(product.id, product_to_dict(product))
+    autocomplete_index.add(product.id, product.name)
     return product
 
 
 async def orm_delete_product(session: AsyncSession, product_id: int):
-    product = await orm_get_product_by_id(session, product_id)
-    if not product:
+    """
+    удаляет товар одним DELETE; комментарии, изображения и позиции корзин
+    удаляет сама бд (ON DELETE CASCADE)
+    """
+    # файлы удалит фоновый воркер после коммита (storage.cleanup)
+    await orm_enqueue_product_images(session, product_id)
+    query = delete(Product).where(Product.id == product_id).returning(Product.name)
+    result = await session.execute(query)
+    name = result.scalar_one_or_none()
+    if name is None:
         raise ProductNotFound()
 
-    else:
-        query = select(ProductImage).where(ProductImage.product_id == product.id)
-        result = await session.execute(query)
-        images = result.scalars().all()
-        for image in images:
-            if os.path.exists(image.image_url):
-                os.remove(image.image_url)
+    await session.commit()
+    await product_cache.delete(product_id)
+    category_cache.invalidate()
+    autocomplete_index.remove(product_id)
+    return f'product "{name}" was successfully deleted'
 
-        await session.delete(product)
-        await session.commit()
-        return f'product "{product.name}" was successfully deleted'
 
+async def orm_add_new_category(
+    session: AsyncSession, category_name: str, parent_id: Optional[int] = None
+):
+    """добавление новой категории, при parent_id - внутрь существующей"""
+    if parent_id is not None:
+        await orm_get_category_by_id(session, parent_id)
 
-async def orm_add_new_category(session: AsyncSession, category_name: str):
-    """добавление новой категории"""
-    new_category = Category(name=category_name)
+    new_category = Category(name=category_name, parent_id=parent_id)
     session.add(new_category)
+    await session.flush()
+
+    # путь до корня: предки родителя на уровень дальше плюс сама категория
+    ancestors = select(
+        CategoryClosure.ancestor_id,
+        literal(new_category.id),
+        CategoryClosure.depth + 1,
+    ).where(CategoryClosure.descendant_id == parent_id)
+    await session.execute(
+        insert(CategoryClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            ancestors.union_all(
+                select(literal(new_category.id), literal(new_category.id), literal(0))
+            ),
+        )
+    )
     await session.commit()
     await session.refresh(new_category)
+    category_cache.invalidate()
     return new_category
 
 
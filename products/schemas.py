@@ -1,6 +1,7 @@
+from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class ProductUpdate(BaseModel):
@@ -8,3 +9,52 @@ class ProductUpdate(BaseModel):
     description: Optional[str]
     price: Optional[float]
     stock: Optional[int]
+
+
+class ProductImportRow(BaseModel):
+    name: str = Field(min_length=1, max_length=255)
+    description: str
+    # границы столбцов staging-таблицы и products: иначе COPY упадет на всей пачке
+    price: float = Field(ge=0, allow_inf_nan=False)
+    stock: int = Field(ge=0, le=2**31 - 1)
+    category_id: Optional[int] = None
+    # вместо category_id можно указать название категории
+    category: Optional[str] = None
+
+
+class CategoryRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+
+
+class ProductImageRead(BaseModel):
+    id: int
+    url: str
+    thumbnail_url: str
+    variants: dict[str, str]
+
+
+class CommentRead(BaseModel):
+    id: int
+    user_id: int
+    username: str
+    text: str
+    created_at: datetime
+
+
+class ProductDetail(BaseModel):
+    id: int
+    name: str
+    description: str
+    price: float
+    stock: int
+    # stock за вычетом удержаний в корзинах
+    available: int
+    created_at: datetime
+    updated_at: datetime
+    category: CategoryRead
+    images: list[ProductImageRead]
+    comments: list[CommentRead]
+    has_more_comments: bool
@@ -0,0 +1,38 @@
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from products.filters import ProductSearchFilter
+from products.models import Product
+
+SEARCH_CONFIG = "simple"
+
+
+async def orm_search_products(
+    session: AsyncSession,
+    text: str,
+    limit: int = 10,
+    offset: int = 0,
+    search_filter: ProductSearchFilter = ProductSearchFilter(),
+):
+    """
+    поиск товаров по названию и описанию. совпадения по словам ищутся через
+    GIN индекс по search_vector, опечатки в названии - через pg_trgm индекс.
+    возвращает пары (товар, релевантность), самые релевантные первыми
+    """
+    ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, text)
+    score = (
+        func.ts_rank_cd(Product.search_vector, ts_query)
+        + func.similarity(Product.name, text)
+    ).label("score")
+
+    query = select(Product, score).where(
+        or_(
+            Product.search_vector.op("@@")(ts_query),
+            Product.name.op("%")(text),
+        )
+    )
+    query = search_filter.filter(query)
+    query = query.order_by(score.desc(), Product.id).limit(limit).offset(offset)
+
+    result = await session.execute(query)
+    return result.all()
@@ -0,0 +1,56 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, Optional
+
+
+class SingleFlight:
+    """
+    схлопывает одинаковые параллельные чтения: пока запрос по ключу выполняется,
+    остальные вызовы с тем же ключом ждут его результат, а не идут в бд сами.
+    timeout ограничивает ожидание каждого вызова, сам общий запрос при этом
+    не отменяется
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.collapsed = 0
+        self.timeouts = 0
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable],
+        timeout: Optional[float] = None,
+    ):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.executed += 1
+        else:
+            self.collapsed += 1
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(task), timeout if timeout is not None else self.timeout
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # исключение могли не забрать, если все ожидающие ушли по таймауту
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "executed": self.executed,
+            "collapsed": self.collapsed,
+            "timeouts": self.timeouts,
+            "in_flight": len(self._calls),
+        }
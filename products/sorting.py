@@ -0,0 +1,33 @@
+from typing import Literal, Optional
+
+from sqlalchemy import ColumnElement, Select
+
+from products.models import Product, ProductStats
+
+ProductSort = Literal["price", "-price", "created_at", "-created_at", "popularity"]
+
+# столбец сортировки; id в конце ключа делает его уникальным для keyset
+_SORT_COLUMNS = {
+    "price": Product.price,
+    "created_at": Product.created_at,
+}
+
+
+def apply_sort(
+    query: Select, sort: Optional[str]
+) -> tuple[Select, tuple[ColumnElement, ...], bool]:
+    """
+    запрос, ключ для paginate_keyset и направление для sort вида "price" или
+    "-price". без sort - порядок по id. ключ совпадает с индексами
+    (category_id, <столбец>, id) и (<столбец>, id), поэтому страница читается
+    из индекса без сортировки всей выборки. popularity - самые популярные
+    первыми, по индексу product_stats (popularity, product_id)
+    """
+    if not sort:
+        return query, (Product.id,), False
+    if sort == "popularity":
+        query = query.join(ProductStats, ProductStats.product_id == Product.id)
+        return query, (ProductStats.popularity, ProductStats.product_id), True
+    descending = sort.startswith("-")
+    column = _SORT_COLUMNS[sort.lstrip("-")]
+    return query, (column, Product.id), descending
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from collections import Counter
+
+from sqlalchemy import BigInteger, Integer, column, update, values
+
+from config import STATS_FLUSH_BATCH, STATS_FLUSH_INTERVAL
+from database import new_session
+from products.autocomplete import autocomplete_index
+from products.models import SALE_WEIGHT, ProductStats
+
+logger = logging.getLogger(__name__)
+
+
+class StatsAggregator:
+    """
+    копит просмотры и продажи товаров в памяти процесса и периодически
+    прибавляет их к product_stats одним UPDATE ... FROM (VALUES ...) на пачку.
+    при ошибке сброса приращения возвращаются в очередь и уйдут со следующим
+    """
+
+    def __init__(self, batch_size: int = STATS_FLUSH_BATCH):
+        self.batch_size = batch_size
+        self._views: Counter[int] = Counter()
+        self._sales: Counter[int] = Counter()
+        self.flushed = 0
+        self.failed = 0
+
+    def record_view(self, product_id: int) -> None:
+        self._views[product_id] += 1
+
+    def record_sales(self, quantities: dict[int, int]) -> None:
+        self._sales.update(quantities)
+
+    def _take(self) -> list[tuple[int, int, int]]:
+        views, sales = self._views, self._sales
+        self._views, self._sales = Counter(), Counter()
+        # одинаковый порядок строк во всех процессах снижает риск взаимных блокировок
+        return [
+            (product_id, views[product_id], sales[product_id])
+            for product_id in sorted(views.keys() | sales.keys())
+        ]
+
+    def _restore(self, rows: list[tuple[int, int, int]]) -> None:
+        for product_id, views, sales in rows:
+            self._views[product_id] += views
+            self._sales[product_id] += sales
+
+    async def _apply(self, rows: list[tuple[int, int, int]]) -> None:
+        delta = values(
+            column("product_id", Integer),
+            column("views", BigInteger),
+            column("sales", BigInteger),
+            name="delta",
+        ).data(rows)
+        query = (
+            update(ProductStats)
+            .where(ProductStats.product_id == delta.c.product_id)
+            .values(
+                views=ProductStats.views + delta.c.views,
+                sales=ProductStats.sales + delta.c.sales,
+            )
+        )
+        async with new_session() as session:
+            await session.execute(query)
+            await session.commit()
+
+    async def flush(self) -> int:
+        """сбрасывает накопленное, возвращает число обновленных товаров"""
+        rows = self._take()
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start : start + self.batch_size]
+            try:
+                await self._apply(batch)
+            except BaseException:
+                self._restore(rows[start:])
+                self.failed += 1
+                raise
+            self.flushed += len(batch)
+            autocomplete_index.add_popularity(
+                {pid: views + SALE_WEIGHT * sales for pid, views, sales in batch}
+            )
+        return len(rows)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._views.keys() | self._sales.keys()),
+            "flushed": self.flushed,
+            "failed": self.failed,
+        }
+
+
+product_stats = StatsAggregator()
+
+
+async def run_stats_flusher():
+    try:
+        while True:
+            await asyncio.sleep(STATS_FLUSH_INTERVAL)
+            try:
+                await product_stats.flush()
+            except Exception:
+                logger.exception("product stats flush failed")
+    finally:
+        # при остановке сбрасываем то, что успело накопиться
+        try:
+            await product_stats.flush()
+        except Exception:
+            logger.exception("final product stats flush failed")
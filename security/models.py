@@ -10,7 +10,7 @@ class RefreshToken(Base):
         UUID(as_uuid=True), primary_key=True, index=True, nullable=False
     )
     user_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("users.id"), nullable=False
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
     expires_at: Mapped[DateTime] = mapped_column(
         DateTime(timezone=True), nullable=False
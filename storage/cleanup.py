@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from config import (
+    IMAGES_DIR,
+    IMAGE_CLEANUP_BATCH,
+    IMAGE_CLEANUP_INTERVAL,
+    ORPHAN_GRACE_PERIOD,
+    ORPHAN_SWEEP_INTERVAL,
+)
+from database import new_session
+from storage.image_store import (
+    TMP_DIR,
+    VARIANT_SIZES,
+    parse_image_name,
+    variant_path,
+)
+from storage.queries import (
+    orm_claim_deletions,
+    orm_finish_deletions,
+    orm_get_image_references,
+)
+from storage.uploads import remove_files
+
+logger = logging.getLogger(__name__)
+
+
+async def _unreferenced(session, paths: list[str]) -> list[str]:
+    """
+    оставляет только файлы, на которые никто не ссылается: оригинал нужен,
+    пока есть запись с таким image_url, варианты - пока есть запись с таким хэшем
+    """
+    parsed = {path: parse_image_name(path) for path in paths}
+    hashes = {content_hash for content_hash, _ in parsed.values() if content_hash}
+    referenced_paths, referenced_hashes = await orm_get_image_references(
+        session, paths, hashes
+    )
+    orphans = []
+    for path, (content_hash, is_variant) in parsed.items():
+        if is_variant:
+            referenced = content_hash in referenced_hashes
+        else:
+            referenced = path in referenced_paths
+        if not referenced:
+            orphans.append(path)
+    return orphans
+
+
+def _remove_stale(paths: list[str], older_than: float) -> tuple[int, dict[str, float]]:
+    """
+    удаляет файлы с mtime не новее older_than. загрузка, переиспользующая файл,
+    обновляет его mtime (storage.image_store._publish), а ее запись о товаре
+    может быть еще не видна проверке ссылок. возвращает число удаленных и
+    mtime пропущенных слишком свежих файлов
+    """
+    removed, fresh = 0, {}
+    for path in paths:
+        try:
+            mtime = os.stat(path).st_mtime
+            if mtime > older_than:
+                fresh[path] = mtime
+                continue
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+    return removed, fresh
+
+
+async def drain_deletion_queue(batch_size: int = IMAGE_CLEANUP_BATCH) -> int:
+    """
+    удаляет с диска одну пачку файлов из очереди, возвращает размер пачки.
+    строка уходит из очереди, когда ее файлы удалены, уже отсутствуют или еще
+    нужны. если файл свежее ORPHAN_GRACE_PERIOD (только что загружен или
+    переиспользован), строка откладывается до конца этого срока
+    """
+    async with new_session() as session:
+        rows = await orm_claim_deletions(session, batch_size)
+        if not rows:
+            return 0
+
+        files = {}
+        for row_id, path in rows:
+            files[row_id] = [path]
+            content_hash, is_variant = parse_image_name(path)
+            if content_hash and not is_variant:
+                files[row_id] += [variant_path(content_hash, n) for n in VARIANT_SIZES]
+
+        candidates = {path for paths in files.values() for path in paths}
+        orphans = await _unreferenced(session, list(candidates))
+        _, fresh = await asyncio.to_thread(
+            _remove_stale, orphans, time.time() - ORPHAN_GRACE_PERIOD
+        )
+
+        done, deferred = [], {}
+        for row_id, paths in files.items():
+            mtimes = [fresh[path] for path in paths if path in fresh]
+            if mtimes:
+                deferred[row_id] = datetime.fromtimestamp(
+                    max(mtimes) + ORPHAN_GRACE_PERIOD, timezone.utc
+                )
+            else:
+                done.append(row_id)
+        await orm_finish_deletions(session, done, deferred)
+        await session.commit()
+        return len(rows)
+
+
+def _list_stale_files(root: str, older_than: float) -> tuple[list[str], list[str]]:
+    """файлы хранилища и временные файлы старше older_than (по mtime)"""
+    files, tmp_files = [], []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                if os.stat(path).st_mtime > older_than:
+                    continue
+            except FileNotFoundError:
+                continue
+            if os.path.dirname(path) == TMP_DIR:
+                tmp_files.append(path)
+            else:
+                files.append(path)
+    return files, tmp_files
+
+
+async def sweep_orphans(chunk_size: int = IMAGE_CLEANUP_BATCH) -> int:
+    """сравнивает images/ с product_images и удаляет файлы без ссылок"""
+    if not os.path.isdir(IMAGES_DIR):
+        return 0
+    older_than = time.time() - ORPHAN_GRACE_PERIOD
+    files, tmp_files = await asyncio.to_thread(
+        _list_stale_files, IMAGES_DIR, older_than
+    )
+    await remove_files(tmp_files)
+
+    removed = len(tmp_files)
+    for start in range(0, len(files), chunk_size):
+        async with new_session() as session:
+            orphans = await _unreferenced(session, files[start : start + chunk_size])
+        # mtime проверяется еще раз: файл могли переиспользовать после обхода
+        chunk_removed, _ = await asyncio.to_thread(_remove_stale, orphans, older_than)
+        removed += chunk_removed
+    return removed
+
+
+async def run_deletion_worker():
+    while True:
+        try:
+            while await drain_deletion_queue() == IMAGE_CLEANUP_BATCH:
+                pass
+        except Exception:
+            logger.exception("image deletion batch failed")
+        await asyncio.sleep(IMAGE_CLEANUP_INTERVAL)
+
+
+async def run_orphan_sweeper():
+    while True:
+        await asyncio.sleep(ORPHAN_SWEEP_INTERVAL)
+        try:
+            removed = await sweep_orphans()
+            logger.info("orphan sweep removed %s image files", removed)
+        except Exception:
+            logger.exception("orphan image sweep failed")
@@ -0,0 +1,47 @@
+import os
+
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse
+
+from config import IMAGES_DIR
+from etag import etag_matches
+from storage.image_store import parse_image_name
+
+router = APIRouter(prefix="/images", tags=["images"])
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+LEGACY_CACHE_CONTROL = "public, max-age=86400"
+
+
+def _resolve(path: str) -> str:
+    root = os.path.realpath(IMAGES_DIR)
+    full_path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full_path]) != root:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if os.path.relpath(full_path, root).split(os.sep)[0] == "tmp":
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return full_path
+
+
+@router.get("/{path:path}")
+async def get_image(path: str, request: Request):
+    full_path = _resolve(path)
+    if not os.path.isfile(full_path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    headers = {}
+    name = os.path.basename(full_path)
+    content_hash, _ = parse_image_name(name)
+    if content_hash:
+        # содержимое по такому имени никогда не меняется: хэш и есть сильный etag
+        etag = f'"{os.path.splitext(name)[0]}"'
+        headers = {"etag": etag, "cache-control": IMMUTABLE_CACHE_CONTROL}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    else:
+        headers = {"cache-control": LEGACY_CACHE_CONTROL}
+
+    # FileResponse отдает файл через http.response.pathsend (sendfile), если
+    # сервер его поддерживает, иначе читает кусками; Range тоже обрабатывает он
+    return FileResponse(full_path, headers=headers)
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+import uuid
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional
+
+from fastapi import UploadFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from config import IMAGES_DIR, IMAGE_PROCESS_WORKERS
+from database import new_session
+from exceptions import InvalidImage
+from storage.queries import orm_enqueue_paths
+from storage.uploads import UploadBudget, remove_files, stream_to_file
+
+logger = logging.getLogger(__name__)
+
+# максимальные размеры (ширина, высота) уменьшенных копий
+VARIANT_SIZES = {"thumb": (200, 200), "medium": (800, 800)}
+VARIANT_FORMAT = "webp"
+
+_EXTENSIONS = {
+    ".jpg": ".jpg",
+    ".jpeg": ".jpg",
+    ".png": ".png",
+    ".gif": ".gif",
+    ".webp": ".webp",
+}
+
+TMP_DIR = os.path.join(IMAGES_DIR, "tmp")
+
+# имена файлов хранилища: <sha256>[_<вариант>].<ext>
+CONTENT_ADDRESSED_NAME = re.compile(r"^([0-9a-f]{64})(_[a-z]+)?(\.[a-z0-9]+)?$")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class StoredImage(NamedTuple):
+    content_hash: str
+    path: str
+    variants: dict[str, str]
+    # файлы, которых не было до этой загрузки (их можно удалить при откате)
+    created: list[str]
+
+
+def shard_dir(content_hash: str) -> str:
+    return os.path.join(IMAGES_DIR, content_hash[:2], content_hash[2:4])
+
+
+def image_path(content_hash: str, extension: str = "") -> str:
+    return os.path.join(shard_dir(content_hash), f"{content_hash}{extension}")
+
+
+def variant_path(content_hash: str, name: str) -> str:
+    return os.path.join(
+        shard_dir(content_hash), f"{content_hash}_{name}.{VARIANT_FORMAT}"
+    )
+
+
+def image_url(path: str) -> str:
+    """адрес файла хранилища в GET /images/{path}"""
+    return "/images/" + os.path.relpath(path, IMAGES_DIR).replace(os.sep, "/")
+
+
+def parse_image_name(path: str) -> tuple[Optional[str], bool]:
+    """хэш содержимого из имени файла (None для старых файлов) и признак варианта"""
+    match = CONTENT_ADDRESSED_NAME.match(os.path.basename(path))
+    if not match:
+        return None, False
+    return match.group(1), match.group(2) is not None
+
+
+def _normalized_extension(filename: Optional[str]) -> str:
+    extension = os.path.splitext(filename or "")[1].lower()
+    return _EXTENSIONS.get(extension, "")
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=IMAGE_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def make_variants(source_path: str, content_hash: str) -> tuple[dict, list]:
+    """
+    выполняется в пуле процессов: создает недостающие уменьшенные копии.
+    возвращает все варианты и список только что созданных файлов. картинка
+    больше Image.MAX_IMAGE_PIXELS (предупреждение переводится в ошибку) и
+    нечитаемый файл дают InvalidImage
+    """
+    variants, created = {}, []
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            original = Image.open(source_path)
+        with original:
+            original.load()
+            for name, size in VARIANT_SIZES.items():
+                path = variant_path(content_hash, name)
+                variants[name] = path
+                try:
+                    # как и оригинал в _publish: переиспользованный файл молодеет
+                    os.utime(path)
+                    continue
+                except FileNotFoundError:
+                    pass
+                # снимки с телефона повернуты тегом EXIF, а не пикселями
+                image = ImageOps.exif_transpose(original)
+                image.thumbnail(size)
+                tmp_path = os.path.join(TMP_DIR, f"{uuid.uuid4().hex}.{VARIANT_FORMAT}")
+                image.save(tmp_path, VARIANT_FORMAT.upper())
+                os.replace(tmp_path, path)
+                created.append(path)
+    except (
+        UnidentifiedImageError,
+        Image.DecompressionBombError,
+        Image.DecompressionBombWarning,
+        OSError,
+    ):
+        for path in created:
+            os.remove(path)
+        raise InvalidImage()
+    return variants, created
+
+
+def _publish(tmp_path: str, path: str) -> bool:
+    """
+    переносит временный файл на место; False если такой файл уже был. у
+    переиспользованного файла обновляется mtime: запись о товаре еще не
+    закоммичена, и очистка не должна считать его сиротой (ORPHAN_GRACE_PERIOD)
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        os.replace(tmp_path, path)
+        return True
+    os.remove(tmp_path)
+    return False
+
+
+async def _store_upload(upload: UploadFile, budget: UploadBudget) -> StoredImage:
+    tmp_path = os.path.join(TMP_DIR, uuid.uuid4().hex)
+    try:
+        content_hash = await stream_to_file(upload, tmp_path, budget)
+    except BaseException:
+        await remove_files([tmp_path])
+        raise
+
+    path = image_path(content_hash, _normalized_extension(upload.filename))
+    created = [path] if await asyncio.to_thread(_publish, tmp_path, path) else []
+
+    loop = asyncio.get_running_loop()
+    try:
+        variants, new_variants = await loop.run_in_executor(
+            _get_pool(), make_variants, path, content_hash
+        )
+    except BaseException:
+        # и при отмене задачи соседней ошибкой в store_uploads
+        await _discard(created)
+        raise
+    created.extend(new_variants)
+    return StoredImage(content_hash, path, variants, created)
+
+
+async def store_uploads(uploads: list[UploadFile]) -> list[StoredImage]:
+    """
+    сохраняет изображения по хэшу содержимого: одинаковые байты хранятся один раз
+    в images/<hh>/<hh>/<hash>.<ext>, рядом лежат уменьшенные копии в webp
+    """
+    await asyncio.to_thread(os.makedirs, TMP_DIR, exist_ok=True)
+
+    budget = UploadBudget()
+    tasks = []
+    try:
+        async with asyncio.TaskGroup() as group:
+            for upload in uploads:
+                tasks.append(group.create_task(_store_upload(upload, budget)))
+    except BaseExceptionGroup as e:
+        created = [
+            path
+            for task in tasks
+            if task.done() and not task.cancelled() and task.exception() is None
+            for path in task.result().created
+        ]
+        await _discard(created)
+        # наружу отдаем первую ошибку, чтобы обработчик мог ее распознать
+        raise e.exceptions[0]
+    return [task.result() for task in tasks]
+
+
+async def _discard(paths: list[str]) -> None:
+    """
+    файлы, созданные откатываемой загрузкой, удаляются не сразу, а через
+    очередь image_deletions: параллельная загрузка тех же байтов могла уже
+    сослаться на них, и воркер очереди перед удалением проверяет ссылки
+    """
+    if not paths:
+        return
+    try:
+        async with new_session() as session:
+            await orm_enqueue_paths(session, paths)
+            await session.commit()
+    except Exception:
+        # файлы без ссылок потом найдет обход сирот
+        logger.exception("failed to enqueue discarded image files")
+
+
+async def discard_stored(images: list[StoredImage]) -> None:
+    """откат загрузки: убирает только файлы, созданные этой загрузкой"""
+    await _discard([path for image in images for path in image.created])
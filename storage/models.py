@@ -0,0 +1,20 @@
+from sqlalchemy import Integer, String, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from database import Base
+
+
+class ImageDeletion(Base):
+    """очередь файлов изображений, которые нужно удалить с диска"""
+
+    __tablename__ = "image_deletions"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    path: Mapped[str] = mapped_column(String, nullable=False)
+    enqueued_at: Mapped[DateTime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    # файл моложе ORPHAN_GRACE_PERIOD откладывается до этого времени
+    not_before: Mapped[DateTime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
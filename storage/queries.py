@@ -0,0 +1,92 @@
+from datetime import datetime
+
+from sqlalchemy import (
+    DateTime,
+    Integer,
+    column,
+    delete,
+    func,
+    insert,
+    or_,
+    select,
+    update,
+    values,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from products.models import ProductImage
+from storage.models import ImageDeletion
+
+
+async def orm_enqueue_product_images(session: AsyncSession, product_id: int):
+    """ставит файлы товара в очередь на удаление одним INSERT ... SELECT"""
+    query = insert(ImageDeletion).from_select(
+        ["path"],
+        select(ProductImage.image_url).where(ProductImage.product_id == product_id),
+    )
+    await session.execute(query)
+
+
+async def orm_enqueue_paths(session: AsyncSession, paths: list[str]):
+    """ставит файлы в очередь на удаление одним INSERT"""
+    if paths:
+        await session.execute(insert(ImageDeletion), [{"path": p} for p in paths])
+
+
+async def orm_claim_deletions(
+    session: AsyncSession, batch_size: int
+) -> list[tuple[int, str]]:
+    """
+    забирает пачку (id, путь) из очереди, время которых пришло. строки
+    блокируются до конца транзакции и удаляются или откладываются в ней же
+    (orm_finish_deletions); SKIP LOCKED не дает двум воркерам взять одни и те же
+    """
+    query = (
+        select(ImageDeletion.id, ImageDeletion.path)
+        .where(ImageDeletion.not_before <= func.now())
+        .order_by(ImageDeletion.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    result = await session.execute(query)
+    return [tuple(row) for row in result.all()]
+
+
+async def orm_finish_deletions(
+    session: AsyncSession, done: list[int], deferred: dict[int, datetime]
+):
+    """
+    убирает из очереди выполненные строки, а отложенные возвращает в нее:
+    deferred - id строки и время, раньше которого ее не брать
+    """
+    if done:
+        await session.execute(delete(ImageDeletion).where(ImageDeletion.id.in_(done)))
+    if deferred:
+        delta = values(
+            column("id", Integer),
+            column("not_before", DateTime(timezone=True)),
+            name="delta",
+        ).data(sorted(deferred.items()))
+        query = (
+            update(ImageDeletion)
+            .where(ImageDeletion.id == delta.c.id)
+            .values(not_before=delta.c.not_before)
+        )
+        await session.execute(query)
+
+
+async def orm_get_image_references(
+    session: AsyncSession, paths: list[str], content_hashes: set[str]
+) -> tuple[set[str], set[str]]:
+    """какие из путей и хэшей еще упоминаются в product_images"""
+    if not paths and not content_hashes:
+        return set(), set()
+    query = select(ProductImage.image_url, ProductImage.content_hash).where(
+        or_(
+            ProductImage.image_url.in_(paths),
+            ProductImage.content_hash.in_(content_hashes),
+        )
+    )
+    result = await session.execute(query)
+    rows = result.all()
+    return {url for url, _ in rows}, {h for _, h in rows if h}
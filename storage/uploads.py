@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import os
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+
+from config import (
+    MAX_IMAGE_SIZE,
+    MAX_REQUEST_SIZE,
+    MAX_UPLOAD_SIZE,
+    UPLOAD_CHUNK_SIZE,
+)
+from exceptions import UploadTooLarge
+
+
+class UploadSizeLimit:
+    """
+    ASGI middleware для multipart-запросов. Starlette принимает все тело во
+    временный файл еще до вызова обработчика, поэтому лимиты stream_to_file
+    срабатывают, когда запрос уже получен целиком. здесь запрос больше limit
+    отклоняется с 413 сразу по Content-Length, а тело без него - как только
+    прочитано больше limit байт
+    """
+
+    def __init__(
+        self,
+        app,
+        limit: int = MAX_REQUEST_SIZE,
+        path_limits: Optional[dict[str, int]] = None,
+    ):
+        self.app = app
+        self.limit = limit
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.path_limits.get(scope["path"], self.limit)
+        detail = f"request body exceeds {limit} bytes limit"
+        content_length = headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse(
+                {"detail": detail},
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                headers={"connection": "close"},
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=detail,
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class UploadBudget:
+    """сколько байт еще можно принять в рамках одного запроса"""
+
+    def __init__(self, limit: int = MAX_UPLOAD_SIZE):
+        self.limit = limit
+        self.used = 0
+
+    def consume(self, size: int):
+        self.used += size
+        if self.used > self.limit:
+            raise UploadTooLarge(
+                message=f"request upload exceeds {self.limit} bytes limit"
+            )
+
+
+async def stream_to_file(
+    upload: UploadFile, file_path: str, budget: UploadBudget
+) -> str:
+    """
+    пишет файл кусками вне event loop, проверяя лимиты по ходу записи.
+    возвращает sha256 содержимого
+    """
+    hasher = hashlib.sha256()
+    buffer = await asyncio.to_thread(open, file_path, "wb")
+
+    def write(chunk: bytes):
+        buffer.write(chunk)
+        hasher.update(chunk)
+
+    try:
+        written = 0
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            written += len(chunk)
+            if written > MAX_IMAGE_SIZE:
+                raise UploadTooLarge(
+                    message=f'image "{upload.filename}" exceeds '
+                    f"{MAX_IMAGE_SIZE} bytes limit"
+                )
+            budget.consume(len(chunk))
+            await asyncio.to_thread(write, chunk)
+    finally:
+        await asyncio.to_thread(buffer.close)
+    return hasher.hexdigest()
+
+
+async def remove_files(paths: list[str]) -> None:
+    def remove():
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    await asyncio.to_thread(remove)
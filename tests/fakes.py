@@ -0,0 +1,68 @@
+import time
+from typing import Callable, Optional
+
+
+class InMemoryKeyValueClient:
+    """
+    подделка redis-клиента (decode_responses=True) для тестов
+    KeyValueProductCache: get/mget/set(ex=...)/delete/scan_iter и pipeline.
+    время берется из clock, чтобы тест мог проматывать сроки жизни
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._data: dict[str, tuple[Optional[float], str]] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= self.clock():
+            del self._data[key]
+            return None
+        return value
+
+    async def mget(self, keys: list[str]) -> list[Optional[str]]:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, value: str, ex: Optional[float] = None) -> None:
+        expires_at = self.clock() + ex if ex is not None else None
+        self._data[key] = (expires_at, value)
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self._data.pop(key, None) is not None for key in keys)
+
+    async def scan_iter(self, match: str):
+        prefix = match.rstrip("*")
+        for key in list(self._data):
+            if key.startswith(prefix):
+                yield key
+
+    def pipeline(self, transaction: bool = True) -> "_Pipeline":
+        return _Pipeline(self)
+
+
+class _Pipeline:
+    """команды копятся и выполняются по execute, как в redis.asyncio"""
+
+    def __init__(self, client: InMemoryKeyValueClient):
+        self.client = client
+        self._commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._commands.clear()
+
+    def set(self, key: str, value: str, ex: Optional[float] = None) -> "_Pipeline":
+        self._commands.append((key, value, ex))
+        return self
+
+    async def execute(self) -> list[bool]:
+        for key, value, ex in self._commands:
+            await self.client.set(key, value, ex=ex)
+        results = [True] * len(self._commands)
+        self._commands.clear()
+        return results
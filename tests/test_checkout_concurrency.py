@@ -0,0 +1,236 @@
+"""
+параллельное оформление заказов по пересекающимся корзинам. нужна бд с
+примененными миграциями (alembic upgrade head) в DB_*; без нее тест пропускается
+"""
+
+import asyncio
+import random
+import uuid
+from collections import Counter
+
+import pytest
+
+import config
+
+if not all((config.DB_USER, config.DB_HOST, config.DB_PORT, config.DB_NAME)):
+    pytest.skip("DB_* is not configured", allow_module_level=True)
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import aliased
+
+from database import engine, new_session
+from users import models
+from security import models
+from products import models
+from cart import models
+from comments import models
+from storage import models
+from cart.models import Cart, CartItem, StockReservation
+from cart.queries import orm_add_product_to_cart, orm_checkout
+from exceptions import InsufficientStock
+from products.cache import product_cache
+from products.models import Category, Product
+from users.models import User
+
+USERS = 30
+PRODUCTS = 6
+STOCK = 12
+
+
+async def _create_carts(tag: str, rng: random.Random) -> tuple[list[int], list[int]]:
+    """
+    товары и корзины, которые вместе просят больше, чем есть на складе. часть
+    позиций добавляется через orm_add_product_to_cart и удерживает товар,
+    остальные вставляются напрямую, как позиции с истекшим удержанием
+    """
+    async with new_session() as session:
+        category = Category(name=f"checkout-{tag}")
+        session.add(category)
+        await session.flush()
+        products = [
+            Product(
+                name=f"checkout-{tag}-{i}",
+                description="",
+                price=1.0,
+                stock=STOCK,
+                category_id=category.id,
+            )
+            for i in range(PRODUCTS)
+        ]
+        users = [
+            User(username=f"checkout-{tag}-{i}", password="", email=f"{tag}-{i}@test")
+            for i in range(USERS)
+        ]
+        session.add_all(products + users)
+        await session.commit()
+        product_ids = [product.id for product in products]
+        user_ids = [user.id for user in users]
+
+    for user_id in user_ids:
+        async with new_session() as session:
+            cart = Cart(user_id=user_id)
+            session.add(cart)
+            await session.flush()
+            held = []
+            for product_id in rng.sample(product_ids, rng.randint(1, 3)):
+                quantity = rng.randint(1, 4)
+                if rng.random() < 0.3:
+                    held.append((product_id, quantity))
+                else:
+                    session.add(
+                        CartItem(
+                            cart_id=cart.id, product_id=product_id, quantity=quantity
+                        )
+                    )
+            await session.commit()
+        for product_id, quantity in held:
+            async with new_session() as session:
+                try:
+                    await orm_add_product_to_cart(
+                        session, user_id, product_id, quantity
+                    )
+                except InsufficientStock:
+                    pass
+    return product_ids, user_ids
+
+
+async def _cart_items(user_ids: list[int]) -> dict[int, dict[int, int]]:
+    async with new_session() as session:
+        query = (
+            select(Cart.user_id, CartItem.product_id, CartItem.quantity)
+            .join(CartItem, CartItem.cart_id == Cart.id)
+            .where(Cart.user_id.in_(user_ids))
+        )
+        result = await session.execute(query)
+    carts: dict[int, dict[int, int]] = {}
+    for user_id, product_id, quantity in result.all():
+        carts.setdefault(user_id, {})[product_id] = quantity
+    return carts
+
+
+async def _stock(product_ids: list[int]) -> dict[int, int]:
+    async with new_session() as session:
+        query = select(Product.id, Product.stock).where(Product.id.in_(product_ids))
+        result = await session.execute(query)
+    return dict(result.all())
+
+
+async def _expected_short(user_id: int) -> set[int]:
+    """позиции корзины, которым не хватает остатка за вычетом чужих удержаний"""
+    async with new_session() as session:
+        held, holder = aliased(CartItem), aliased(Cart)
+        others = (
+            select(func.coalesce(func.sum(StockReservation.quantity), 0))
+            .join(held, held.id == StockReservation.cart_item_id)
+            .join(holder, holder.id == held.cart_id)
+            .where(
+                StockReservation.product_id == CartItem.product_id,
+                holder.user_id != user_id,
+            )
+            .correlate(CartItem)
+            .scalar_subquery()
+        )
+        query = (
+            select(CartItem.product_id)
+            .join(Cart, Cart.id == CartItem.cart_id)
+            .join(Product, Product.id == CartItem.product_id)
+            .where(Cart.user_id == user_id, Product.stock - others < CartItem.quantity)
+        )
+        result = await session.execute(query)
+    return set(result.scalars().all())
+
+
+async def _checkout(user_id: int):
+    async with new_session() as session:
+        try:
+            await orm_checkout(session, user_id)
+        except InsufficientStock as e:
+            return e
+    return None
+
+
+async def _cleanup(tag: str):
+    async with new_session() as session:
+        await session.execute(
+            delete(User).where(User.username.like(f"checkout-{tag}-%"))
+        )
+        await session.execute(
+            delete(Product).where(Product.name.like(f"checkout-{tag}-%"))
+        )
+        await session.execute(
+            delete(Category).where(Category.name == f"checkout-{tag}")
+        )
+        await session.commit()
+
+
+async def _run():
+    tag = uuid.uuid4().hex[:8]
+    try:
+        product_ids, user_ids = await _create_carts(tag, random.Random(tag))
+        carts = await _cart_items(user_ids)
+        before = await _stock(product_ids)
+
+        # исключения, кроме нехватки товара (например, deadlock), валят тест
+        outcomes = await asyncio.gather(*(_checkout(user_id) for user_id in carts))
+        after = await _stock(product_ids)
+        remaining = await _cart_items(user_ids)
+
+        sold = Counter()
+        for user_id, outcome in zip(carts, outcomes):
+            if outcome is None:
+                assert user_id not in remaining
+                sold.update(carts[user_id])
+                continue
+            # при нехватке корзина не тронута, а в ошибке только реально
+            # недостающие позиции этой корзины
+            assert remaining[user_id] == carts[user_id]
+            assert outcome.items
+            for item in outcome.items:
+                assert carts[user_id][item["product_id"]] == item["requested"]
+                assert item["available"] < item["requested"]
+
+        assert any(outcome is None for outcome in outcomes)
+        assert any(outcome is not None for outcome in outcomes)
+        for product_id in product_ids:
+            assert after[product_id] >= 0
+            assert before[product_id] - after[product_id] == sold[product_id]
+
+        # без конкуренции ошибка перечисляет ровно все недостающие позиции
+        for user_id in remaining:
+            expected = await _expected_short(user_id)
+            outcome = await _checkout(user_id)
+            if not expected:
+                assert outcome is None
+                continue
+            assert {item["product_id"] for item in outcome.items} == expected
+    finally:
+        await _cleanup(tag)
+        await engine.dispose()
+
+
+def test_concurrent_checkouts_do_not_oversell():
+    asyncio.run(_run())
+
+
+async def _run_invalidation():
+    tag = uuid.uuid4().hex[:8]
+    try:
+        product_ids, user_ids = await _create_carts(tag, random.Random(tag))
+        carts = await _cart_items(user_ids)
+        for user_id, items in carts.items():
+            if not await _expected_short(user_id):
+                break
+        for product_id in product_ids:
+            await product_cache.set(product_id, {"id": product_id})
+
+        assert await _checkout(user_id) is None
+        cached = await product_cache.get_many(product_ids)
+        assert cached.keys() == set(product_ids) - items.keys()
+    finally:
+        await product_cache.clear()
+        await _cleanup(tag)
+        await engine.dispose()
+
+
+def test_checkout_invalidates_sold_products_in_cache():
+    asyncio.run(_run_invalidation())
@@ -0,0 +1,143 @@
+"""
+поведение кэшей товаров: LRUProductCache и KeyValueProductCache поверх
+подделки redis-клиента. модули проекта импортируют database, которому нужны DB_*
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import config
+
+if not all((config.DB_USER, config.DB_HOST, config.DB_PORT, config.DB_NAME)):
+    pytest.skip("DB_* is not configured", allow_module_level=True)
+
+import products.cache
+from products.cache import KeyValueProductCache, LRUProductCache
+from tests.fakes import InMemoryKeyValueClient
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def product(product_id: int) -> dict:
+    return {"id": product_id, "name": f"product {product_id}", "price": 1.5}
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(products.cache, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_lru_evicts_least_recently_read(clock):
+    async def scenario():
+        cache = LRUProductCache(max_size=2, ttl=60)
+        await cache.set(1, product(1))
+        await cache.set(2, product(2))
+        assert await cache.get(1) == product(1)
+        await cache.set(3, product(3))
+        assert await cache.get(2) is None
+        assert await cache.get(1) == product(1)
+        assert await cache.get(3) == product(3)
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["evictions"]) == (3, 1, 1)
+        assert stats["size"] == 2
+
+    run(scenario())
+
+
+def test_lru_expires_entries(clock):
+    async def scenario():
+        cache = LRUProductCache(max_size=10, ttl=60)
+        await cache.set(1, product(1))
+        clock.now += 59
+        assert await cache.get(1) == product(1)
+        clock.now += 1
+        assert await cache.get(1) is None
+        assert cache.stats()["size"] == 0
+
+    run(scenario())
+
+
+def test_lru_delete_and_clear(clock):
+    async def scenario():
+        cache = LRUProductCache(max_size=10, ttl=60)
+        for product_id in (1, 2, 3):
+            await cache.set(product_id, product(product_id))
+        await cache.delete(1, 3, 42)
+        assert await cache.get_many([1, 2, 3]) == {2: product(2)}
+        await cache.clear()
+        assert await cache.get(2) is None
+
+    run(scenario())
+
+
+def test_key_value_round_trip_and_expiry():
+    async def scenario():
+        clock = Clock()
+        cache = KeyValueProductCache(InMemoryKeyValueClient(clock), ttl=60)
+        assert await cache.get(1) is None
+        await cache.set(1, product(1))
+        assert await cache.get(1) == product(1)
+        clock.now += 60
+        assert await cache.get(1) is None
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    run(scenario())
+
+
+def test_key_value_get_many_and_set_many():
+    async def scenario():
+        clock = Clock()
+        cache = KeyValueProductCache(InMemoryKeyValueClient(clock), ttl=60)
+        await cache.set_many({1: product(1), 2: product(2)})
+        clock.now += 30
+        await cache.set_many({3: product(3)})
+        assert await cache.get_many([]) == {}
+        assert await cache.get_many([1, 2, 3, 4]) == {
+            1: product(1),
+            2: product(2),
+            3: product(3),
+        }
+        clock.now += 30
+        assert await cache.get_many([1, 2, 3]) == {3: product(3)}
+        assert (cache.hits, cache.misses) == (4, 3)
+
+    run(scenario())
+
+
+def test_key_value_delete_invalidates_all_given_ids():
+    async def scenario():
+        cache = KeyValueProductCache(InMemoryKeyValueClient(), ttl=60)
+        await cache.set_many({pid: product(pid) for pid in (1, 2, 3)})
+        # так checkout сбрасывает проданные товары одним вызовом
+        await cache.delete(1, 3)
+        await cache.delete()
+        assert await cache.get_many([1, 2, 3]) == {2: product(2)}
+
+    run(scenario())
+
+
+def test_key_value_clear_removes_only_product_keys():
+    async def scenario():
+        client = InMemoryKeyValueClient()
+        cache = KeyValueProductCache(client, ttl=60)
+        await client.set("session:1", "other")
+        await cache.set_many({1: product(1), 2: product(2)})
+        await cache.clear()
+        assert await cache.get_many([1, 2]) == {}
+        assert await client.get("session:1") == "other"
+
+    run(scenario())
@@ -22,9 +22,9 @@ class User(Base):
     )
 
     cart: Mapped[Optional["Cart"]] = relationship(
-        back_populates="user", cascade="all, delete-orphan"
+        back_populates="user", cascade="all, delete-orphan", passive_deletes=True
     )
 
     comments: Mapped[list["Comment"]] = relationship(
-        back_populates="user", cascade="all, delete-orphan"
+        back_populates="user", cascade="all, delete-orphan", passive_deletes=True
     )
@@ -1,4 +1,4 @@
-from sqlalchemy import select
+from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from exceptions import UserNotFound
@@ -60,7 +60,14 @@ async def orm_change_password(user_id: int, new_password: str, session: AsyncSes
 
 
 async def orm_delete_user(user_id: int, session: AsyncSession):
-    user = await orm_get_user_by_id(user_id, session)
-    await session.delete(user)
+    """
+    удаляет пользователя одним DELETE; корзину, комментарии и токены
+    удаляет сама бд (ON DELETE CASCADE)
+    """
+    query = delete(User).where(User.id == user_id).returning(User.username)
+    result = await session.execute(query)
+    username = result.scalar_one_or_none()
+    if username is None:
+        raise UserNotFound()
     await session.commit()
-    return f"{user.username}'s profile was successfully deleted"
+    return f"{username}'s profile was successfully deleted"